@@ -1,4 +1,11 @@
+import collections
+import multiprocessing
+import numpy
+import os
 import pytest
+import struct
+import zlib
+from multiprocessing import shared_memory
 
 x1, x2, y1, y2 = -1.8, 1.8, -1.8, 1.8
 c_real, c_imag = -0.62772, -0.42193
@@ -6,6 +13,56 @@ c_real, c_imag = -0.62772, -0.42193
 def test_julia_set():
     assert sum(julia_set(1000, 300)) == 33219980
 
+def test_julia_set_numpy():
+    assert numpy.sum(julia_set_numpy(1000, 300)) == 33219980
+
+def test_julia_set_parallel():
+    assert numpy.sum(julia_set_parallel(1000, 300, workers=2)) == 33219980
+
+def test_julia_set_fast():
+    assert numpy.sum(julia_set_fast(1000, 300, validate=True)) == 33219980
+
+def test_julia_viewport():
+    v = JuliaViewport(200, 150, max_iterations=100, tile=64)
+    x, y = v.axes()
+    assert numpy.array_equal(v.render(), julia_kernel(x, y, 100))
+    assert (v.hits, v.misses) == (0, 12)
+    v.pan(64, 0)
+    x, y = v.axes()
+    assert numpy.array_equal(v.render(), julia_kernel(x, y, 100))
+    assert (v.hits, v.misses) == (9, 15)
+    v.max_iterations = 300
+    assert numpy.array_equal(v.render(), julia_kernel(x, y, 300))
+    assert (v.hits, v.misses) == (21, 15)
+    v.zoom(2)
+    x, y = v.axes()
+    assert numpy.array_equal(v.render(), julia_kernel(x, y, 300))
+
+def test_julia_rows(tmp_path):
+    assert sum(int(numpy.sum(r)) for r in julia_rows(1000, 300, rows=96)) == 33219980
+    assert numpy.sum(julia_to_memmap(tmp_path / "julia.bin", 1000, 300)) == 33219980
+
+def test_julia_to_png(tmp_path):
+    julia_to_png(tmp_path / "julia.png", 1000, 300, rows=96)
+    with open(tmp_path / "julia.png", "rb") as f:
+        data = f.read()
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    chunks, i = [], 8
+    while i < len(data):
+        length, = struct.unpack(">I", data[i:i + 4])
+        kind, body = data[i + 4:i + 8], data[i + 8:i + 8 + length]
+        assert struct.unpack(">I", data[i + 8 + length:i + 12 + length])[0] == zlib.crc32(kind + body)
+        chunks.append((kind, body))
+        i += 12 + length
+    assert chunks[0][0] == b"IHDR" and chunks[-1][0] == b"IEND"
+    width, height, depth, color = struct.unpack(">IIBB", chunks[0][1][:10])
+    assert (width, height, depth, color) == (1000, 1000, 16, 0)
+    raw = zlib.decompress(b"".join(body for kind, body in chunks if kind == b"IDAT"))
+    rows = numpy.frombuffer(raw, dtype=numpy.uint8).reshape(height, 2 * width + 1)
+    assert not rows[:, 0].any()
+    pixels = rows[:, 1:].copy().view(">u2")
+    assert numpy.sum(pixels, dtype=numpy.int64) == 33219980
+
 def julia_set(desired_width, max_iterations):
     x_step = (x2 - x1) / desired_width
     y_step = (y1 - y2) / desired_width
@@ -35,3 +92,246 @@ def julia_set(desired_width, max_iterations):
             n += 1
         output[i] = n
     return output
+
+def julia_axes(desired_width):
+    x_step = (x2 - x1) / desired_width
+    y_step = (y1 - y2) / desired_width
+    x = []
+    y = []
+    ycoord = y2
+    while ycoord > y1:
+        y.append(ycoord)
+        ycoord += y_step
+    xcoord = x1
+    while xcoord < x2:
+        x.append(xcoord)
+        xcoord += x_step
+    return numpy.array(x), numpy.array(y)
+
+def julia_kernel(x, y, max_iterations):
+    z = numpy.empty((len(y), len(x)), dtype=numpy.complex128)
+    z.real = x[numpy.newaxis, :]
+    z.imag = y[:, numpy.newaxis]
+    z = z.ravel()
+    output = numpy.zeros(z.size, dtype=numpy.int64)
+    julia_iterate(z, numpy.arange(z.size), output, 0, max_iterations)
+    return output.reshape(len(y), len(x))
+
+def julia_iterate(z, i, output, start, stop, c=complex(c_real, c_imag)):
+    for n in range(start, stop):
+        # drop the points that escaped so only the active set is iterated
+        m = numpy.abs(z) < 2
+        if not m.all():
+            z = z[m]
+            i = i[m]
+            if z.size == 0:
+                break
+        numpy.multiply(z, z, z)
+        numpy.add(z, c, z)
+        output[i] = n + 1
+    return z, i
+
+def julia_set_numpy(desired_width, max_iterations):
+    x, y = julia_axes(desired_width)
+    return julia_kernel(x, y, max_iterations).ravel()
+
+def julia_kernel_fast(x, y, max_iterations):
+    zr = numpy.repeat(x[numpy.newaxis, :], len(y), axis=0).ravel()
+    zi = numpy.repeat(y[:, numpy.newaxis], len(x), axis=1).ravel()
+    i = numpy.arange(zr.size)
+    output = numpy.full(zr.size, max_iterations, dtype=numpy.int64)
+    # orbit points saved at every power of two iteration for the
+    # periodicity check, where an exact repeat means the point is caught
+    # in a cycle and can never escape
+    sr = zr.copy()
+    si = zi.copy()
+    rr = numpy.empty_like(zr)
+    ii = numpy.empty_like(zr)
+    # finished points keep iterating until enough of them are dropped at
+    # once, so their values may overflow without affecting the output
+    live = numpy.ones(zr.size, dtype=bool)
+    done = 0
+    with numpy.errstate(over="ignore", invalid="ignore"):
+        for n in range(max_iterations):
+            # compare the squared magnitude to avoid the square root
+            numpy.multiply(zr, zr, rr)
+            numpy.multiply(zi, zi, ii)
+            e = rr + ii >= 4
+            e &= live
+            if e.any():
+                output[i[e]] = n
+                live &= ~e
+                done += numpy.count_nonzero(e)
+            # z * z + c with the same rounding as the complex multiplication
+            numpy.multiply(zr, zi, zi)
+            numpy.add(zi, zi, zi)
+            numpy.add(zi, c_imag, zi)
+            numpy.subtract(rr, ii, zr)
+            numpy.add(zr, c_real, zr)
+            p = zr == sr
+            p &= zi == si
+            p &= live
+            if p.any():
+                live &= ~p
+                done += numpy.count_nonzero(p)
+            if n & (n + 1) == 0:
+                numpy.copyto(sr, zr)
+                numpy.copyto(si, zi)
+            if done > zr.size // 4:
+                zr, zi, sr, si, rr, ii, i = zr[live], zi[live], sr[live], si[live], rr[live], ii[live], i[live]
+                live = numpy.ones(zr.size, dtype=bool)
+                done = 0
+                if zr.size == 0:
+                    break
+    return output.reshape(len(y), len(x))
+
+def julia_set_fast(desired_width, max_iterations, validate=False):
+    x, y = julia_axes(desired_width)
+    output = julia_kernel_fast(x, y, max_iterations)
+    if validate:
+        # prove that the shortcuts give the same counts as the reference
+        reference = julia_kernel(x, y, max_iterations)
+        if not numpy.array_equal(output, reference):
+            raise AssertionError("{} of {} points differ from the reference".format(
+                numpy.count_nonzero(output != reference), output.size))
+    return output.ravel()
+
+def julia_rows(desired_width, max_iterations, rows=64):
+    if max_iterations > 65535:
+        raise ValueError("max_iterations does not fit in uint16")
+    x, y = julia_axes(desired_width)
+    for r in range(0, len(y), rows):
+        yield julia_kernel(x, y[r : r + rows], max_iterations).astype(numpy.uint16)
+
+def julia_to_memmap(filename, desired_width, max_iterations, rows=64):
+    x, y = julia_axes(desired_width)
+    output = numpy.memmap(filename, dtype=numpy.uint16, mode="w+", shape=(len(y), len(x)))
+    r = 0
+    for block in julia_rows(desired_width, max_iterations, rows):
+        output[r : r + len(block)] = block
+        r += len(block)
+    output.flush()
+    return output
+
+def julia_to_png(filename, desired_width, max_iterations, rows=64):
+    def chunk(f, kind, data):
+        f.write(struct.pack(">I", len(data)) + kind + data)
+        f.write(struct.pack(">I", zlib.crc32(kind + data)))
+    x, y = julia_axes(desired_width)
+    compressor = zlib.compressobj()
+    with open(filename, "wb") as f:
+        # 16-bit grayscale image written one compressed block of rows at a time
+        f.write(b"\x89PNG\r\n\x1a\n")
+        chunk(f, b"IHDR", struct.pack(">IIBBBBB", len(x), len(y), 16, 0, 0, 0, 0))
+        for block in julia_rows(desired_width, max_iterations, rows):
+            data = numpy.zeros((len(block), 2 * len(x) + 1), dtype=numpy.uint8)
+            data[:, 1:] = block.astype(">u2").view(numpy.uint8)
+            chunk(f, b"IDAT", compressor.compress(data.tobytes()))
+        chunk(f, b"IDAT", compressor.flush())
+        chunk(f, b"IEND", b"")
+
+def _julia_attach(name, x, y, max_iterations):
+    global _julia_shm, _julia_out, _julia_args
+    _julia_shm = shared_memory.SharedMemory(name=name)
+    _julia_out = numpy.ndarray((len(y), len(x)), dtype=numpy.int64, buffer=_julia_shm.buf)
+    _julia_args = (x, y, max_iterations)
+
+def _julia_tile(tile):
+    x, y, max_iterations = _julia_args
+    r0, r1, c0, c1 = tile
+    _julia_out[r0:r1, c0:c1] = julia_kernel(x[c0:c1], y[r0:r1], max_iterations)
+
+def julia_set_parallel(desired_width, max_iterations, workers=None, tile=64):
+    x, y = julia_axes(desired_width)
+    shm = shared_memory.SharedMemory(create=True, size=len(x) * len(y) * 8)
+    try:
+        # hand out one tile at a time so that workers that finish cheap
+        # tiles far from the set pick up the remaining ones
+        tiles = [(r, min(r + tile, len(y)), c, min(c + tile, len(x)))
+                 for r in range(0, len(y), tile) for c in range(0, len(x), tile)]
+        with multiprocessing.Pool(workers or os.cpu_count(), _julia_attach, (shm.name, x, y, max_iterations)) as pool:
+            for _ in pool.imap_unordered(_julia_tile, tiles, chunksize=1):
+                pass
+        output = numpy.ndarray((len(y), len(x)), dtype=numpy.int64, buffer=shm.buf).ravel().copy()
+    finally:
+        shm.close()
+        shm.unlink()
+    return output
+
+class JuliaViewport:
+    """
+    Pan and zoom view of the Julia set assembled from cached tiles
+
+    Tiles are cached by their position, zoom level and c together with the
+    orbit of every point that has not escaped yet, so panning only computes
+    the tiles that come into view and raising max_iterations resumes the
+    cached orbits. The least recently used tiles beyond maxsize are evicted.
+    """
+
+    def __init__(self, width, height, c=complex(c_real, c_imag), max_iterations=300, tile=64, maxsize=1024):
+        self.width = width
+        self.height = height
+        self.c = c
+        self.max_iterations = max_iterations
+        self.tile = tile
+        self.maxsize = maxsize
+        self.level = 0
+        self.px = 0
+        self.py = 0
+        self.cache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def step(self):
+        return (x2 - x1) / self.width / 2 ** self.level
+
+    def axes(self):
+        x = x1 + numpy.arange(self.px, self.px + self.width) * self.step()
+        y = y2 - numpy.arange(self.py, self.py + self.height) * self.step()
+        return x, y
+
+    def pan(self, dx, dy):
+        self.px += dx
+        self.py += dy
+
+    def zoom(self, levels=1):
+        # keep the pixel in the center of the view in place
+        cx = (2 * self.px + self.width) * 2 ** levels
+        cy = (2 * self.py + self.height) * 2 ** levels
+        self.px = int((cx - self.width) // 2)
+        self.py = int((cy - self.height) // 2)
+        self.level += levels
+
+    def render(self):
+        T = self.tile
+        tx0, ty0 = self.px // T, self.py // T
+        tx1, ty1 = (self.px + self.width - 1) // T, (self.py + self.height - 1) // T
+        image = numpy.empty(((ty1 - ty0 + 1) * T, (tx1 - tx0 + 1) * T), dtype=numpy.int64)
+        for ty in range(ty0, ty1 + 1):
+            for tx in range(tx0, tx1 + 1):
+                r, c = (ty - ty0) * T, (tx - tx0) * T
+                image[r : r + T, c : c + T] = self.render_tile(tx, ty)
+        r, c = self.py - ty0 * T, self.px - tx0 * T
+        return image[r : r + self.height, c : c + self.width]
+
+    def render_tile(self, tx, ty):
+        T = self.tile
+        key = (tx, ty, self.level, self.c)
+        entry = self.cache.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            z = numpy.empty((T, T), dtype=numpy.complex128)
+            z.real = (x1 + numpy.arange(tx * T, tx * T + T) * self.step())[numpy.newaxis, :]
+            z.imag = (y2 - numpy.arange(ty * T, ty * T + T) * self.step())[:, numpy.newaxis]
+            entry = (numpy.zeros(T * T, dtype=numpy.int64), z.ravel(), numpy.arange(T * T), 0)
+        else:
+            self.hits += 1
+        output, z, i, n = entry
+        if n < self.max_iterations and z.size:
+            z, i = julia_iterate(z, i, output, n, self.max_iterations, self.c)
+            n = self.max_iterations
+        self.cache[key] = (output, z, i, n)
+        while len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+        # counts computed with a higher limit are clipped to the current one
+        return numpy.minimum(output, self.max_iterations).reshape(T, T)
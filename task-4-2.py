@@ -1,8 +1,16 @@
 import array
+import concurrent.futures
+import json
+import math
+import multiprocessing
 import numpy
+import os
+import platform
 import pytest
 import random
+import tempfile
 import timeit
+from multiprocessing import resource_tracker, shared_memory
 
 def test_dgemm_array():
     N = 128
@@ -28,6 +36,131 @@ def test_dgemm_numpy():
     dgemm_numpy(X, Y, Z, N)
     assert numpy.allclose(C, Z)
 
+def test_dgemm_blocked():
+    N = 100
+    A = [[random.random() for _ in range(N)] for _ in range(N)]
+    B = [[random.random() for _ in range(N)] for _ in range(N)]
+    C = [[random.random() for _ in range(N)] for _ in range(N)]
+    X = array.array("d", (v for r in A for v in r))
+    Y = array.array("d", (v for r in B for v in r))
+    Z = array.array("d", (v for r in C for v in r))
+    U = numpy.array(A, dtype="float64")
+    V = numpy.array(B, dtype="float64")
+    W = numpy.array(C, dtype="float64")
+    dgemm_lists(A, B, C, N)
+    dgemm_blocked(X, Y, Z, N, 32, 64)
+    dgemm_blocked(U, V, W, N, 32, 64)
+    assert numpy.allclose(numpy.array(C).flatten(), Z)
+    assert numpy.allclose(C, W)
+
+def test_dgemm_strassen():
+    N = 100
+    A = [[random.random() for _ in range(N)] for _ in range(N)]
+    B = [[random.random() for _ in range(N)] for _ in range(N)]
+    C = [[random.random() for _ in range(N)] for _ in range(N)]
+    X = numpy.array(A, dtype="float64")
+    Y = numpy.array(B, dtype="float64")
+    Z = numpy.array(C, dtype="float64")
+    dgemm_lists(A, B, C, N)
+    dgemm_strassen(X, Y, Z, N, 16)
+    assert numpy.allclose(C, Z)
+
+def test_dgemm_parallel():
+    N = 128
+    A = [[random.random() for _ in range(N)] for _ in range(N)]
+    B = [[random.random() for _ in range(N)] for _ in range(N)]
+    C = [[random.random() for _ in range(N)] for _ in range(N)]
+    X = numpy.array(A, dtype="float64")
+    Y = numpy.array(B, dtype="float64")
+    Z = numpy.array(C, dtype="float64")
+    dgemm_lists(A, B, C, N)
+    dgemm_parallel(X, Y, Z, N, workers=2, cpus=[0], block=(48, 80))
+    assert numpy.allclose(C, Z)
+    shm, U, V, W = dgemm_shared(N)
+    try:
+        U[:], V[:], W[:] = X, Y, 0.0
+        with dgemm_pool(2) as pool:
+            dgemm_parallel(U, V, W, N, block=(48, 80), shm=shm, pool=pool)
+            assert numpy.allclose(W, numpy.matmul(X, Y))
+            dgemm_parallel(U, V, W, N, shm=shm, pool=pool)
+            assert numpy.allclose(W, 2 * numpy.matmul(X, Y))
+            with pytest.raises(ValueError):
+                dgemm_parallel(X, Y, Z, N, shm=shm, pool=pool)
+            with pytest.raises(ValueError):
+                dgemm_parallel(U, V, W[1:], N, shm=shm, pool=pool)
+        del U, V, W
+    finally:
+        shm.close()
+        shm.unlink()
+
+def test_dgemm_memmap(tmp_path):
+    N = 100
+    A = [[random.random() for _ in range(N)] for _ in range(N)]
+    B = [[random.random() for _ in range(N)] for _ in range(N)]
+    C = [[random.random() for _ in range(N)] for _ in range(N)]
+    X = numpy.memmap(tmp_path / "A.bin", dtype="float64", mode="w+", shape=(N, N))
+    Y = numpy.memmap(tmp_path / "B.bin", dtype="float64", mode="w+", shape=(N, N))
+    Z = numpy.memmap(tmp_path / "C.bin", dtype="float64", mode="w+", shape=(N, N))
+    X[:], Y[:], Z[:] = A, B, C
+    dgemm_lists(A, B, C, N)
+    dgemm_memmap(X, Y, Z, N, 32)
+    assert numpy.allclose(C, numpy.memmap(tmp_path / "C.bin", dtype="float64", shape=(N, N)))
+
+def test_dgemm_batched():
+    N = 8
+    A = [[[random.random() for _ in range(N)] for _ in range(N)] for _ in range(5000)]
+    B = [[[random.random() for _ in range(N)] for _ in range(N)] for _ in range(5000)]
+    C = [[[random.random() for _ in range(N)] for _ in range(N)] for _ in range(5000)]
+    X = numpy.array(A, dtype="float64")
+    Y = numpy.array(B, dtype="float64")
+    Z = numpy.array(C, dtype="float64")
+    for i in range(0, 5000, 499):
+        dgemm_lists(A[i], B[i], C[i], N)
+    dgemm_batched(X, Y, Z, N)
+    for i in range(0, 5000, 499):
+        assert numpy.allclose(C[i], Z[i])
+
+def test_dgemm_mixed():
+    N = 128
+    A = [[random.random() for _ in range(N)] for _ in range(N)]
+    B = [[random.random() for _ in range(N)] for _ in range(N)]
+    C = [[random.random() for _ in range(N)] for _ in range(N)]
+    X = numpy.array(A, dtype="float64")
+    Y = numpy.array(B, dtype="float64")
+    Z = numpy.array(C, dtype="float64")
+    W = numpy.array(C, dtype="float64")
+    dgemm_lists(A, B, C, N)
+    dgemm_mixed(X, Y, Z, N)
+    dgemm_mixed(X, Y, W, N, 7)
+    assert numpy.allclose(C, Z, rtol=1e-5, atol=0)
+    assert numpy.allclose(C, W, rtol=1e-13, atol=0)
+
+def test_dgemm(tmp_path):
+    N = 64
+    A = [[random.random() for _ in range(N)] for _ in range(N)]
+    B = [[random.random() for _ in range(N)] for _ in range(N)]
+    C = [[random.random() for _ in range(N)] for _ in range(N)]
+    X = numpy.array(A, dtype="float64")
+    Y = numpy.array(B, dtype="float64")
+    Z = numpy.array(C, dtype="float64")
+    U = array.array("d", (v for r in A for v in r))
+    V = array.array("d", (v for r in B for v in r))
+    W = array.array("d", (v for r in C for v in r))
+    D = [r.copy() for r in C]
+    dgemm_lists(A, B, C, N)
+    dgemm(X, Y, Z, N, tmp_path / "tuning.json")
+    dgemm(U, V, W, N, tmp_path / "tuning.json")
+    dgemm(A, B, D, N, tmp_path / "tuning.json")
+    assert numpy.allclose(C, Z)
+    assert numpy.allclose(numpy.array(C).flatten(), W)
+    assert numpy.allclose(C, D)
+    with open(tmp_path / "tuning.json") as f:
+        table = json.load(f)[platform.node()]
+    assert table["numpy:64"]["kernel"] in dgemm_kernels
+    assert table["array:64"]["kernel"] in dgemm_kernels
+    assert table["lists:64"]["kernel"] == "dgemm_lists"
+    assert os.listdir(tmp_path) == ["tuning.json"]
+
 def dgemm_lists(A, B, C, N):
     t0 = timeit.default_timer()
     for i in range(N):
@@ -46,8 +179,274 @@ def dgemm_array(A, B, C, N):
     t1 = timeit.default_timer()
     return t1 - t0
 
+def dgemm_blocked(A, B, C, N, bk=64, bj=256):
+    t0 = timeit.default_timer()
+    a = memoryview(A).cast("B").cast("d")
+    b = memoryview(B).cast("B").cast("d")
+    c = memoryview(C).cast("B").cast("d")
+    for kk in range(0, N, bk):
+        k1 = min(kk + bk, N)
+        for jj in range(0, N, bj):
+            j1 = min(jj + bj, N)
+            P = [b[N*k+jj:N*k+j1].tolist() for k in range(kk, k1)]
+            for i in range(N):
+                row = c[N*i+jj:N*i+j1].tolist()
+                for v, Bk in zip(a[N*i+kk:N*i+k1].tolist(), P):
+                    row = [x + v * y for x, y in zip(row, Bk)]
+                c[N*i+jj:N*i+j1] = array.array("d", row)
+    t1 = timeit.default_timer()
+    return t1 - t0
+
 def dgemm_numpy(A, B, C, N):
     t0 = timeit.default_timer()
     numpy.add(C, numpy.matmul(A, B), C)
     t1 = timeit.default_timer()
     return t1 - t0
+
+def strassen(A, B, cutoff):
+    n = A.shape[0]
+    if n <= cutoff or n % 2:
+        return numpy.matmul(A, B)
+    h = n // 2
+    A11, A12, A21, A22 = A[:h, :h], A[:h, h:], A[h:, :h], A[h:, h:]
+    B11, B12, B21, B22 = B[:h, :h], B[:h, h:], B[h:, :h], B[h:, h:]
+    M1 = strassen(A11 + A22, B11 + B22, cutoff)
+    M2 = strassen(A21 + A22, B11, cutoff)
+    M3 = strassen(A11, B12 - B22, cutoff)
+    M4 = strassen(A22, B21 - B11, cutoff)
+    M5 = strassen(A11 + A12, B22, cutoff)
+    M6 = strassen(A21 - A11, B11 + B12, cutoff)
+    M7 = strassen(A12 - A22, B21 + B22, cutoff)
+    C = numpy.empty((n, n), dtype=A.dtype)
+    C[:h, :h] = M1 + M4 - M5 + M7
+    C[:h, h:] = M3 + M5
+    C[h:, :h] = M2 + M4
+    C[h:, h:] = M1 - M2 + M3 + M6
+    return C
+
+def dgemm_strassen(A, B, C, N, cutoff=512):
+    t0 = timeit.default_timer()
+    # pad to a size that halves evenly all the way down to the cutoff
+    k = 0
+    while -(-N // 2**k) > cutoff:
+        k += 1
+    P = -(-N // 2**k) * 2**k
+    if P != N:
+        A = numpy.pad(A, ((0, P - N), (0, P - N)))
+        B = numpy.pad(B, ((0, P - N), (0, P - N)))
+    numpy.add(C, strassen(A, B, cutoff)[:N, :N], C)
+    t1 = timeit.default_timer()
+    return t1 - t0
+
+def _dgemm_attach(cpus):
+    global _dgemm_shm, _dgemm_mats
+    # pin this worker to the next core of the requested placement
+    if cpus is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {cpus.get()})
+    _dgemm_shm = None
+    _dgemm_mats = None
+
+def _dgemm_block(name, N, r0, r1, c0, c1):
+    global _dgemm_shm, _dgemm_mats
+    # map the operands once per segment and keep only the latest mapping,
+    # so a long-lived pool does not hold on to segments of earlier calls
+    if _dgemm_shm is None or _dgemm_shm.name != name:
+        if _dgemm_shm is not None:
+            _dgemm_mats = None
+            _dgemm_shm.close()
+        _dgemm_shm = shared_memory.SharedMemory(name=name)
+        _dgemm_mats = numpy.ndarray((3, N, N), dtype="float64", buffer=_dgemm_shm.buf)
+    A, B, C = _dgemm_mats
+    C[r0:r1, c0:c1] += numpy.matmul(A[r0:r1], B[:, c0:c1])
+
+def dgemm_shared(N):
+    # A, B and C backed by one shared memory segment, to be filled in place
+    # and passed to dgemm_parallel together with the segment
+    shm = shared_memory.SharedMemory(create=True, size=3 * N * N * 8)
+    M = numpy.ndarray((3, N, N), dtype="float64", buffer=shm.buf)
+    return shm, M[0], M[1], M[2]
+
+def dgemm_pool(workers=None, cpus=None):
+    workers = workers or len(cpus or []) or os.cpu_count()
+    # workers must share the resource tracker of this process, or each one
+    # starts its own and reports the caller's segments as leaked on exit
+    resource_tracker.ensure_running()
+    queue = None
+    if cpus is not None:
+        queue = multiprocessing.Queue()
+        for i in range(workers):
+            queue.put(cpus[i % len(cpus)])
+    return multiprocessing.Pool(workers, _dgemm_attach, (queue,))
+
+def dgemm_parallel(A, B, C, N, workers=None, cpus=None, block=None, shm=None, pool=None):
+    t0 = timeit.default_timer()
+    workers = workers or len(cpus or []) or os.cpu_count()
+    br, bc = block or (-(-N // workers), N)
+    blocks = [(r, min(r + br, N), c, min(c + bc, N)) for r in range(0, N, br) for c in range(0, N, bc)]
+    owned = shm is None
+    if not owned:
+        # workers only see the segment, so the operands must be its views
+        M = numpy.ndarray((3, N, N), dtype="float64", buffer=shm.buf)
+        for name, X, Y in zip("ABC", (A, B, C), M):
+            if not (isinstance(X, numpy.ndarray) and X.__array_interface__ == Y.__array_interface__):
+                raise ValueError("{} is not the {} operand of the shared memory segment".format(name, name))
+    if owned:
+        # operands outside shared memory are copied into a temporary segment
+        shm, *M = dgemm_shared(N)
+        M[0][:], M[1][:], M[2][:] = A, B, C
+    try:
+        if pool is None:
+            with dgemm_pool(workers, cpus) as pool:
+                pool.starmap(_dgemm_block, [(shm.name, N) + b for b in blocks])
+        else:
+            pool.starmap(_dgemm_block, [(shm.name, N) + b for b in blocks])
+        if owned:
+            numpy.copyto(C, M[2])
+            del M
+    finally:
+        if owned:
+            shm.close()
+            shm.unlink()
+    t1 = timeit.default_timer()
+    return t1 - t0
+
+def dgemm_memmap(A, B, C, N, tile=2048):
+    t0 = timeit.default_timer()
+    def load(i, j, k):
+        return numpy.array(A[i:i+tile, k:k+tile]), numpy.array(B[k:k+tile, j:j+tile])
+    steps = [(i, j, k) for i in range(0, N, tile) for j in range(0, N, tile) for k in range(0, N, tile)]
+    with concurrent.futures.ThreadPoolExecutor(1) as reader:
+        # read the next pair of tiles ahead while the current pair multiplies
+        ahead = reader.submit(load, *steps[0])
+        for s, (i, j, k) in enumerate(steps):
+            X, Y = ahead.result()
+            if s + 1 < len(steps):
+                ahead = reader.submit(load, *steps[s + 1])
+            if k == 0:
+                Z = numpy.array(C[i:i+tile, j:j+tile])
+            Z += numpy.matmul(X, Y)
+            if k + tile >= N:
+                C[i:i+tile, j:j+tile] = Z
+    if isinstance(C, numpy.memmap):
+        C.flush()
+    t1 = timeit.default_timer()
+    return t1 - t0
+
+def dgemm_batched(A, B, C, N):
+    t0 = timeit.default_timer()
+    # multiply the stack in chunks whose products stay in cache before
+    # they are accumulated into C
+    k = max(1, 2**15 // (N * N))
+    T = numpy.empty((k, N, N), dtype=C.dtype)
+    for s in range(0, len(C), k):
+        e = min(s + k, len(C))
+        numpy.matmul(A[s:e], B[s:e], T[:e-s])
+        numpy.add(C[s:e], T[:e-s], C[s:e])
+    t1 = timeit.default_timer()
+    return t1 - t0
+
+def _dgemm_slices(M, b, slices, axis):
+    # scale every row of A or column of B by a power of two into [-1, 1]
+    # and cut it into slices of b bits that float32 holds exactly
+    s = numpy.max(numpy.abs(M), axis=axis, keepdims=True)
+    s = numpy.exp2(numpy.ceil(numpy.log2(numpy.where(s > 0, s, 1.0))))
+    X = M / s
+    H = []
+    for _ in range(slices):
+        h = numpy.trunc(X * 2.0**b)
+        X = X * 2.0**b - h
+        H.append(h.astype("float32"))
+    return s, H
+
+def dgemm_mixed(A, B, C, N, slices=0):
+    t0 = timeit.default_timer()
+    if slices == 0:
+        numpy.add(C, numpy.matmul(A.astype("float32"), B.astype("float32")), C)
+    else:
+        # products of b-bit slices summed over kb terms stay below 2^24, so
+        # every float32 product is exact and only the slices dropped past
+        # the last one limit the accuracy
+        kb = min(N, 256)
+        b = (24 - math.ceil(math.log2(kb))) // 2
+        sA, SA = _dgemm_slices(A, b, slices, 1)
+        sB, SB = _dgemm_slices(B, b, slices, 0)
+        T = numpy.zeros((N, N))
+        for i in range(slices):
+            for j in range(slices - i):
+                for k in range(0, N, kb):
+                    P = numpy.matmul(SA[i][:, k:k+kb], SB[j][k:k+kb])
+                    T += P.astype("float64") * 2.0**(-b * (i + j + 2))
+        numpy.add(C, T * sA * sB, C)
+    t1 = timeit.default_timer()
+    return t1 - t0
+
+dgemm_kernels = {
+    "dgemm_lists":    dgemm_lists,
+    "dgemm_array":    dgemm_array,
+    "dgemm_blocked":  dgemm_blocked,
+    "dgemm_numpy":    dgemm_numpy,
+    "dgemm_strassen": dgemm_strassen,
+    "dgemm_parallel": dgemm_parallel,
+}
+
+dgemm_tuning = {}
+
+def dgemm_candidates(kind, N):
+    if kind == "lists":
+        return [("dgemm_lists", {})]
+    if kind == "array":
+        c = [("dgemm_blocked", {"bk": bk, "bj": bj}) for bk, bj in [(32, 128), (64, 256), (128, 512)]]
+        return c + [("dgemm_array", {})] if N <= 64 else c
+    c = [("dgemm_numpy", {})]
+    c += [("dgemm_strassen", {"cutoff": v}) for v in [256, 512, 1024] if v < N]
+    return c + [("dgemm_parallel", {})] if N >= 512 and os.cpu_count() > 1 else c
+
+def dgemm_tune(kind, N, repeats=3):
+    candidates = dgemm_candidates(kind, N)
+    if len(candidates) == 1:
+        return {"kernel": candidates[0][0], "args": candidates[0][1]}
+    if kind == "numpy":
+        A, B, C = (numpy.random.random_sample((N, N)) for _ in range(3))
+    elif kind == "array":
+        A, B, C = (array.array("d", (random.random() for _ in range(N * N))) for _ in range(3))
+    else:
+        A, B, C = ([[random.random() for _ in range(N)] for _ in range(N)] for _ in range(3))
+    best = None
+    for name, args in candidates:
+        t = min(dgemm_kernels[name](A, B, C, N, **args) for _ in range(repeats))
+        if best is None or t < best[0]:
+            best = (t, name, args)
+    return {"kernel": best[1], "args": best[2]}
+
+def dgemm(A, B, C, N, cache=None):
+    t0 = timeit.default_timer()
+    if isinstance(C, numpy.ndarray):
+        kind = "numpy"
+    elif isinstance(C, array.array):
+        kind = "array"
+    else:
+        kind = "lists"
+    # size buckets are the powers of two, tuned once per host and kept in
+    # the tuning cache for later calls and later runs
+    key = "{}:{}".format(kind, 1 << (N - 1).bit_length())
+    path = os.fspath(cache or os.environ.get("DGEMM_TUNING", os.path.expanduser("~/.cache/dgemm_tuning.json")))
+    if path not in dgemm_tuning:
+        try:
+            with open(path) as f:
+                dgemm_tuning[path] = json.load(f)
+        except (OSError, ValueError):
+            dgemm_tuning[path] = {}
+    table = dgemm_tuning[path].setdefault(platform.node(), {})
+    if key not in table:
+        table[key] = dgemm_tune(kind, N)
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        # a private temporary file and an atomic rename, so that concurrent
+        # processes never see or write over each other's partial files
+        with tempfile.NamedTemporaryFile("w", dir=folder, delete=False) as f:
+            json.dump(dgemm_tuning[path], f, indent=2)
+        os.replace(f.name, path)
+    entry = table[key]
+    dgemm_kernels[entry["kernel"]](A, B, C, N, **entry["args"])
+    t1 = timeit.default_timer()
+    return t1 - t0
@@ -1,3 +1,5 @@
+import cmath
+import functools
 import logging
 import math
 import numpy
@@ -12,6 +14,26 @@ def test_dft():
     assert numpy.allclose(Xr, [2.0, -2.0,  0.0, 4.0])
     assert numpy.allclose(Xi, [0.0, -2.0, -2.0, 4.0])
 
+def test_fft():
+    xr = [1.0,  2.0,  0.0, -1.0]
+    xi = [0.0, -1.0, -1.0,  2.0]
+    Xr = [0.0,  0.0,  0.0,  0.0]
+    Xi = [0.0,  0.0,  0.0,  0.0]
+    fft(xr, xi, Xr, Xi, 4)
+    assert numpy.allclose(Xr, [2.0, -2.0,  0.0, 4.0])
+    assert numpy.allclose(Xi, [0.0, -2.0, -2.0, 4.0])
+    for N in [1, 2, 3, 12, 17, 60, 64, 97, 162, 17 * 19]:
+        xr = list(numpy.random.random_sample(N))
+        xi = list(numpy.random.random_sample(N))
+        Xr = [0.0] * N
+        Xi = [0.0] * N
+        Yr = [0.0] * N
+        Yi = [0.0] * N
+        dft(xr, xi, Xr, Xi, N)
+        fft(xr, xi, Yr, Yi, N)
+        assert numpy.allclose(Xr, Yr)
+        assert numpy.allclose(Xi, Yi)
+
 def dft(xr, xi, Xr, Xi, N):
     for k in range(N):
         for n in range(N):
@@ -19,6 +41,65 @@ def dft(xr, xi, Xr, Xi, N):
             Xi[k] += xi[n] * math.cos(2 * math.pi * k * n / N) - xr[n] * math.sin(2 * math.pi * k * n / N)
             logging.info("X[{}]: {:8.5f}{:+8.5f}i".format(k, Xr[k], Xi[k]))
 
+@functools.lru_cache(maxsize=64)
+def _twiddles(N):
+    return tuple(cmath.exp(-2j * math.pi * j / N) for j in range(N))
+
+def _factor(N):
+    return next((f for f in range(2, math.isqrt(N) + 1) if N % f == 0), N)
+
+def _fft(z):
+    N = len(z)
+    if N == 1:
+        return z
+    p = _factor(N)
+    if p == N and N > 16:
+        return _bluestein([z])[0]
+    # decimation in time: p interleaved sub-transforms of length m, combined
+    # with the twiddles W_N^(rk) and a p-point DFT across the sub-transforms
+    m = N // p
+    if m > 16 and _factor(m) == m:
+        S = _bluestein([z[r::p] for r in range(p)])
+    else:
+        S = [_fft(z[r::p]) for r in range(p)]
+    w = _twiddles(N)
+    if p == 2:
+        t = [b * w[k] for k, b in enumerate(S[1])]
+        return [a + b for a, b in zip(S[0], t)] + [a - b for a, b in zip(S[0], t)]
+    X = [0j] * N
+    T = [[S[r][k] * w[r * k] for r in range(p)] for k in range(m)]
+    if p > 16:
+        # a large radix makes every combination a prime-size DFT, which are
+        # done together so they share the chirp and its transform
+        for k, t in enumerate(_bluestein(T)):
+            X[k::m] = t
+        return X
+    for k, t in enumerate(T):
+        for q in range(p):
+            X[k + q * m] = sum(t[r] * w[(r * q * m) % N] for r in range(p))
+    return X
+
+def _bluestein(Z):
+    N = len(Z[0])
+    M = 1 << (2 * N - 2).bit_length()
+    # kn = (k^2 + n^2 - (k-n)^2) / 2 turns each prime-size DFT of Z into a
+    # circular convolution of power-of-two length M
+    w = [cmath.exp(1j * math.pi * (n * n % (2 * N)) / N) for n in range(N)]
+    B = _fft(w + [0j] * (M - 2 * N + 1) + w[:0:-1])
+    X = []
+    for z in Z:
+        a = [z[n] * w[n].conjugate() for n in range(N)] + [0j] * (M - N)
+        c = [u * v for u, v in zip(_fft(a), B)]
+        c = _fft([v.conjugate() for v in c])
+        X.append([c[k].conjugate() / M * w[k].conjugate() for k in range(N)])
+    return X
+
+def fft(xr, xi, Xr, Xi, N):
+    X = _fft([complex(xr[n], xi[n]) for n in range(N)])
+    for k in range(N):
+        Xr[k] += X[k].real
+        Xi[k] += X[k].imag
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
     xr = [1.0,  2.0,  0.0, -1.0]
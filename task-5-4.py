@@ -1,9 +1,12 @@
+import cmath
+import functools
 import math
 import matplotlib.pyplot as plt
 import numpy
 import pytest
 import random
 import timeit
+import tracemalloc
 
 def test_dft_list():
     xr = [1.0,  2.0,  0.0, -1.0]
@@ -44,6 +47,51 @@ def test_dft_numpy():
     assert numpy.allclose(Xr, Yr)
     assert numpy.allclose(Xi, Yi)
 
+def test_dft_numpy_blocked():
+    N  = 1000
+    xr = numpy.random.random_sample(N)
+    xi = numpy.random.random_sample(N)
+    Xr = numpy.full(N, 0.0)
+    Xi = numpy.full(N, 0.0)
+    Yr = numpy.full(N, 0.0)
+    Yi = numpy.full(N, 0.0)
+    dft_numpy(xr, xi, Xr, Xi, N)
+    tracemalloc.start()
+    dft_numpy(xr, xi, Yr, Yi, N, block=48)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert numpy.allclose(Xr, Yr)
+    assert numpy.allclose(Xi, Yi)
+    assert peak < N * N * 8 / 4
+
+def test_fft_list():
+    for N in [4, 12, 17, 64, 97, 162, 17 * 19]:
+        xr = [random.random() for _ in range(N)]
+        xi = [random.random() for _ in range(N)]
+        Xr = [0.0] * N
+        Xi = [0.0] * N
+        Yr = Xr.copy()
+        Yi = Xi.copy()
+        dft_list(xr, xi, Xr, Xi, N)
+        fft_list(xr, xi, Yr, Yi, N)
+        assert numpy.allclose(Xr, Yr)
+        assert numpy.allclose(Xi, Yi)
+
+def test_fft_numpy():
+    for N in [4, 12, 17, 64, 97, 162, 257, 500, 17 * 19]:
+        xr = [random.random() for _ in range(N)]
+        xi = [random.random() for _ in range(N)]
+        Xr = [0.0] * N
+        Xi = [0.0] * N
+        yr = numpy.array(xr)
+        yi = numpy.array(xi)
+        Yr = numpy.array(Xr)
+        Yi = numpy.array(Xi)
+        dft_list(xr, xi, Xr, Xi, N)
+        fft_numpy(yr, yi, Yr, Yi, N)
+        assert numpy.allclose(Xr, Yr)
+        assert numpy.allclose(Xi, Yi)
+
 def dft_list(xr, xi, Xr, Xi, N):
     t0 = timeit.default_timer()
     for k in range(N):
@@ -66,20 +114,134 @@ def dft_list_opt(xr, xi, Xr, Xi, N):
     t1 = timeit.default_timer()
     return t1 - t0
 
-def dft_numpy(xr, xi, Xr, Xi, N):
+def dft_numpy(xr, xi, Xr, Xi, N, block=None):
     t0 = timeit.default_timer()
     a  = 2 * math.pi / N
     v  = numpy.arange(float(N))
-    Wr = numpy.outer(v, v)
-    Wi = numpy.outer(v, v)
-    numpy.multiply(a, Wr, Wr)
-    numpy.multiply(a, Wi, Wi)
-    numpy.cos(Wr, Wr)
-    numpy.sin(Wi, Wi)
-    numpy.add(Xr, numpy.matmul(Wr,  xr), Xr)
-    numpy.add(Xr, numpy.matmul(Wi,  xi), Xr)
-    numpy.add(Xi, numpy.matmul(Wi, -xr), Xi)
-    numpy.add(Xi, numpy.matmul(Wr,  xi), Xi)
+    b  = N if block is None else min(block, N)
+    # only b rows of twiddles live at a time, so peak memory is O(N*b)
+    Wr = numpy.empty((b, N))
+    Wi = numpy.empty((b, N))
+    for k0 in range(0, N, b):
+        k1 = min(k0 + b, N)
+        wr = Wr[:k1 - k0]
+        wi = Wi[:k1 - k0]
+        numpy.outer(v[k0:k1], v, wr)
+        numpy.multiply(a, wr, wr)
+        numpy.sin(wr, wi)
+        numpy.cos(wr, wr)
+        numpy.add(Xr[k0:k1], numpy.matmul(wr, xr), Xr[k0:k1])
+        numpy.add(Xr[k0:k1], numpy.matmul(wi, xi), Xr[k0:k1])
+        numpy.subtract(Xi[k0:k1], numpy.matmul(wi, xr), Xi[k0:k1])
+        numpy.add(Xi[k0:k1], numpy.matmul(wr, xi), Xi[k0:k1])
+    t1 = timeit.default_timer()
+    return t1 - t0
+
+@functools.lru_cache(maxsize=64)
+def _twiddles(N):
+    return tuple(cmath.exp(-2j * math.pi * j / N) for j in range(N))
+
+def _factor(N):
+    return next((f for f in range(2, math.isqrt(N) + 1) if N % f == 0), N)
+
+def _fft(z):
+    N = len(z)
+    if N == 1:
+        return z
+    p = _factor(N)
+    if p == N and N > 16:
+        return _bluestein([z])[0]
+    # decimation in time: p interleaved sub-transforms of length m, combined
+    # with the twiddles W_N^(rk) and a p-point DFT across the sub-transforms
+    m = N // p
+    if m > 16 and _factor(m) == m:
+        S = _bluestein([z[r::p] for r in range(p)])
+    else:
+        S = [_fft(z[r::p]) for r in range(p)]
+    w = _twiddles(N)
+    if p == 2:
+        t = [b * w[k] for k, b in enumerate(S[1])]
+        return [a + b for a, b in zip(S[0], t)] + [a - b for a, b in zip(S[0], t)]
+    X = [0j] * N
+    T = [[S[r][k] * w[r * k] for r in range(p)] for k in range(m)]
+    if p > 16:
+        # a large radix makes every combination a prime-size DFT, which are
+        # done together so they share the chirp and its transform
+        for k, t in enumerate(_bluestein(T)):
+            X[k::m] = t
+        return X
+    for k, t in enumerate(T):
+        for q in range(p):
+            X[k + q * m] = sum(t[r] * w[(r * q * m) % N] for r in range(p))
+    return X
+
+def _bluestein(Z):
+    N = len(Z[0])
+    M = 1 << (2 * N - 2).bit_length()
+    # kn = (k^2 + n^2 - (k-n)^2) / 2 turns each prime-size DFT of Z into a
+    # circular convolution of power-of-two length M
+    w = [cmath.exp(1j * math.pi * (n * n % (2 * N)) / N) for n in range(N)]
+    B = _fft(w + [0j] * (M - 2 * N + 1) + w[:0:-1])
+    X = []
+    for z in Z:
+        a = [z[n] * w[n].conjugate() for n in range(N)] + [0j] * (M - N)
+        c = [u * v for u, v in zip(_fft(a), B)]
+        c = _fft([v.conjugate() for v in c])
+        X.append([c[k].conjugate() / M * w[k].conjugate() for k in range(N)])
+    return X
+
+def fft_list(xr, xi, Xr, Xi, N):
+    t0 = timeit.default_timer()
+    X  = _fft([complex(xr[n], xi[n]) for n in range(N)])
+    for k in range(N):
+        Xr[k] += X[k].real
+        Xi[k] += X[k].imag
+    t1 = timeit.default_timer()
+    return t1 - t0
+
+def _fft_numpy(z):
+    N = z.shape[-1]
+    if N == 1:
+        return z
+    # radix 4 halves the number of passes over the data for powers of two
+    p = 4 if N % 4 == 0 and N > 4 else next((f for f in range(2, math.isqrt(N) + 1) if N % f == 0), N)
+    if p == N and N > 64:
+        return _bluestein_numpy(z)
+    # decimation in time over the last axis, batched over the leading axes:
+    # row r of S is the transform of z[..., r::p]
+    m = N // p
+    S = _fft_numpy(numpy.swapaxes(z.reshape(z.shape[:-1] + (m, p)), -1, -2))
+    r = numpy.arange(p)
+    k = numpy.arange(m)
+    S = S * numpy.exp(-2j * math.pi * (numpy.outer(r, k) % N) / N)
+    if p == 2:
+        return numpy.concatenate((S[..., 0, :] + S[..., 1, :], S[..., 0, :] - S[..., 1, :]), -1)
+    if p > 64:
+        # a large radix is itself a prime-size DFT across the sub-transforms
+        S = numpy.swapaxes(_bluestein_numpy(numpy.swapaxes(S, -1, -2)), -1, -2)
+        return S.reshape(z.shape)
+    W = numpy.exp(-2j * math.pi * (numpy.outer(r, r) % p) / p)
+    return numpy.matmul(W, S).reshape(z.shape)
+
+def _bluestein_numpy(z):
+    N = z.shape[-1]
+    M = 1 << (2 * N - 2).bit_length()
+    n = numpy.arange(N)
+    w = numpy.exp(1j * math.pi * (n * n % (2 * N)) / N)
+    a = numpy.zeros(z.shape[:-1] + (M,), dtype=complex)
+    b = numpy.zeros(M, dtype=complex)
+    a[..., :N] = z * w.conj()
+    b[:N] = w
+    b[M - N + 1:] = w[:0:-1]
+    c = _fft_numpy(a) * _fft_numpy(b)
+    c = _fft_numpy(c.conj()).conj() / M
+    return c[..., :N] * w.conj()
+
+def fft_numpy(xr, xi, Xr, Xi, N):
+    t0 = timeit.default_timer()
+    X  = _fft_numpy(numpy.asarray(xr) + 1j * numpy.asarray(xi))
+    numpy.add(Xr, X.real, Xr)
+    numpy.add(Xi, X.imag, Xi)
     t1 = timeit.default_timer()
     return t1 - t0
 
@@ -89,8 +251,8 @@ if __name__ == "__main__":
     fig.supylabel("Time (s)")
     xticks = [8, 16, 32, 64, 128, 256, 512, 1024]
     yticks = [1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1e-0]
-    x = [[], [], []]
-    y = [[], [], []]
+    x = [[], [], [], [], []]
+    y = [[], [], [], [], []]
     for n in xticks:
         xr = [random.random() for _ in range(n)]
         xi = [random.random() for _ in range(n)]
@@ -109,10 +271,24 @@ if __name__ == "__main__":
         for _ in range(10):
             x[2].append(n)
             y[2].append(dft_numpy(xr, xi, numpy.full(n, 0.0), numpy.full(n, 0.0), n))
+    for n in xticks:
+        xr = [random.random() for _ in range(n)]
+        xi = [random.random() for _ in range(n)]
+        for _ in range(10):
+            x[3].append(n)
+            y[3].append(fft_list(xr, xi, [0.0] * n, [0.0] * n, n))
+    for n in xticks:
+        xr = numpy.random.random_sample(n)
+        xi = numpy.random.random_sample(n)
+        for _ in range(10):
+            x[4].append(n)
+            y[4].append(fft_numpy(xr, xi, numpy.full(n, 0.0), numpy.full(n, 0.0), n))
     ax.grid()
     ax.scatter(x[0], y[0], alpha=0.25, color="C0", label="dft_list")
     ax.scatter(x[1], y[1], alpha=0.25, color="C1", label="dft_list_opt")
     ax.scatter(x[2], y[2], alpha=0.25, color="C2", label="dft_numpy")
+    ax.scatter(x[3], y[3], alpha=0.25, color="C3", label="fft_list")
+    ax.scatter(x[4], y[4], alpha=0.25, color="C4", label="fft_numpy")
     ax.legend(loc="center left", bbox_to_anchor=(1, 0.5))
     plt.xscale("log")
     plt.yscale("log")
@@ -2,20 +2,72 @@ import math
 import numpy
 import timeit
 
-def dft_numpy(xr, xi, Xr, Xi, N):
+def dft_numpy(xr, xi, Xr, Xi, N, block=None):
     t0 = timeit.default_timer()
     a  = 2 * math.pi / N
     v  = numpy.arange(float(N))
-    Wr = numpy.outer(v, v)
-    Wi = numpy.outer(v, v)
-    numpy.multiply(a, Wr, Wr)
-    numpy.multiply(a, Wi, Wi)
-    numpy.cos(Wr, Wr)
-    numpy.sin(Wi, Wi)
-    numpy.add(Xr, numpy.matmul(Wr,  xr), Xr)
-    numpy.add(Xr, numpy.matmul(Wi,  xi), Xr)
-    numpy.add(Xi, numpy.matmul(Wi, -xr), Xi)
-    numpy.add(Xi, numpy.matmul(Wr,  xi), Xi)
+    b  = N if block is None else min(block, N)
+    # only b rows of twiddles live at a time, so peak memory is O(N*b)
+    Wr = numpy.empty((b, N))
+    Wi = numpy.empty((b, N))
+    for k0 in range(0, N, b):
+        k1 = min(k0 + b, N)
+        wr = Wr[:k1 - k0]
+        wi = Wi[:k1 - k0]
+        numpy.outer(v[k0:k1], v, wr)
+        numpy.multiply(a, wr, wr)
+        numpy.sin(wr, wi)
+        numpy.cos(wr, wr)
+        numpy.add(Xr[k0:k1], numpy.matmul(wr, xr), Xr[k0:k1])
+        numpy.add(Xr[k0:k1], numpy.matmul(wi, xi), Xr[k0:k1])
+        numpy.subtract(Xi[k0:k1], numpy.matmul(wi, xr), Xi[k0:k1])
+        numpy.add(Xi[k0:k1], numpy.matmul(wr, xi), Xi[k0:k1])
+    t1 = timeit.default_timer()
+    return t1 - t0
+
+def _fft_numpy(z):
+    N = z.shape[-1]
+    if N == 1:
+        return z
+    # radix 4 halves the number of passes over the data for powers of two
+    p = 4 if N % 4 == 0 and N > 4 else next((f for f in range(2, math.isqrt(N) + 1) if N % f == 0), N)
+    if p == N and N > 64:
+        return _bluestein_numpy(z)
+    # decimation in time over the last axis, batched over the leading axes:
+    # row r of S is the transform of z[..., r::p]
+    m = N // p
+    S = _fft_numpy(numpy.swapaxes(z.reshape(z.shape[:-1] + (m, p)), -1, -2))
+    r = numpy.arange(p)
+    k = numpy.arange(m)
+    S = S * numpy.exp(-2j * math.pi * (numpy.outer(r, k) % N) / N)
+    if p == 2:
+        return numpy.concatenate((S[..., 0, :] + S[..., 1, :], S[..., 0, :] - S[..., 1, :]), -1)
+    if p > 64:
+        # a large radix is itself a prime-size DFT across the sub-transforms
+        S = numpy.swapaxes(_bluestein_numpy(numpy.swapaxes(S, -1, -2)), -1, -2)
+        return S.reshape(z.shape)
+    W = numpy.exp(-2j * math.pi * (numpy.outer(r, r) % p) / p)
+    return numpy.matmul(W, S).reshape(z.shape)
+
+def _bluestein_numpy(z):
+    N = z.shape[-1]
+    M = 1 << (2 * N - 2).bit_length()
+    n = numpy.arange(N)
+    w = numpy.exp(1j * math.pi * (n * n % (2 * N)) / N)
+    a = numpy.zeros(z.shape[:-1] + (M,), dtype=complex)
+    b = numpy.zeros(M, dtype=complex)
+    a[..., :N] = z * w.conj()
+    b[:N] = w
+    b[M - N + 1:] = w[:0:-1]
+    c = _fft_numpy(a) * _fft_numpy(b)
+    c = _fft_numpy(c.conj()).conj() / M
+    return c[..., :N] * w.conj()
+
+def fft_numpy(xr, xi, Xr, Xi, N):
+    t0 = timeit.default_timer()
+    X  = _fft_numpy(numpy.asarray(xr) + 1j * numpy.asarray(xi))
+    numpy.add(Xr, X.real, Xr)
+    numpy.add(Xi, X.imag, Xi)
     t1 = timeit.default_timer()
     return t1 - t0
 
@@ -26,3 +78,15 @@ if __name__ == "__main__":
     Xr = numpy.full(N, 0.0)
     Xi = numpy.full(N, 0.0)
     print(f"dft_numpy: {N:d} elements, {dft_numpy(xr, xi, Xr, Xi, N):.6f} seconds")
+    Yr = numpy.full(N, 0.0)
+    Yi = numpy.full(N, 0.0)
+    print(f"dft_numpy: {N:d} elements, {dft_numpy(xr, xi, Yr, Yi, N, max(1, 2**16 // N)):.6f} seconds (blocked)")
+    Xr = numpy.full(N, 0.0)
+    Xi = numpy.full(N, 0.0)
+    print(f"fft_numpy: {N:d} elements, {fft_numpy(xr, xi, Xr, Xi, N):.6f} seconds")
+    N  = 1 << 22
+    xr = numpy.random.random_sample(N)
+    xi = numpy.random.random_sample(N)
+    Xr = numpy.full(N, 0.0)
+    Xi = numpy.full(N, 0.0)
+    print(f"fft_numpy: {N:d} elements, {fft_numpy(xr, xi, Xr, Xi, N):.6f} seconds")
@@ -3,20 +3,119 @@ A simple Python/matplotlib implementation of Conway's Game of Life.
 """
 
 import sys, argparse
+import os
+import queue
+import subprocess
+import threading
+import time
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
+import pytest
 
 ON = 255
 OFF = 0
 vals = [ON, OFF]
 
 
+class _Image:
+    def set_data(self, data):
+        pass
+
+
+def test_update_batch():
+    B, N = 6, 20
+    A = randomGrids(B, N)
+    # gliders sitting on the edges make every board wrap around its own torus
+    A[0] = OFF
+    addGlider(N - 3, N - 3, A[0])
+    A[1] = OFF
+    addGlider(0, N - 3, A[1])
+    singles = [A[b].copy() for b in range(B)]
+    for _ in range(40):
+        pop = update_batch(A)
+        for b in range(B):
+            update(0, _Image(), singles[b], N)
+            assert np.array_equal(A[b], singles[b])
+            assert pop[b] == np.count_nonzero(singles[b])
+
+
+def test_update_stripes():
+    N = 50
+    A = randomGrid(N)
+    B = A.astype(np.uint8)
+    C = np.empty_like(B)
+    for _ in range(20):
+        update_batch(A[None])
+        update_stripes(B, C, N, 7)
+        B, C = C, B
+        assert np.array_equal(A, B)
+
+
+def test_checkpoint(tmp_path):
+    N = 50
+    A = randomGrid(N).astype(np.uint8)
+    B = np.empty_like(A)
+    for _ in range(5):
+        update_stripes(A, B, N, 7)
+        A, B = B, A
+    save_checkpoint(tmp_path / "grid.ckpt", A, 5, 7)
+    grid, generation = load_checkpoint(tmp_path / "grid.ckpt", tmp_path / "grid.dat", 7)
+    assert generation == 5
+    assert np.array_equal(A, grid)
+    # resuming from the checkpoint continues exactly like the original run
+    other = np.empty_like(grid)
+    for _ in range(10):
+        update_stripes(A, B, N, 7)
+        A, B = B, A
+        update_stripes(grid, other, N, 7)
+        grid, other = other, grid
+    assert np.array_equal(A, grid)
+
+
+def test_export_frames():
+    N = 32
+    A = randomGrid(N)
+    # an encoder that reads a single frame and exits breaks the pipe, which
+    # must neither hang the simulation nor leak the pipe
+    command = [sys.executable, "-c", "import sys; sys.stdin.buffer.read({})".format(N * N)]
+    export_frames(A, N, 200, None, size=2, command=command)
+    command = [sys.executable, "-c", "import sys; sys.exit(len(sys.stdin.buffer.read()) != {})".format(N * N * 10)]
+    export_frames(A, N, 10, None, command=command)
+
+
+def test_export_frames_interrupted(monkeypatch):
+    N = 32
+    A = randomGrid(N)
+    calls = []
+
+    def interrupted(grids):
+        calls.append(None)
+        if len(calls) == 5:
+            raise KeyboardInterrupt
+        return update_batch(grids)
+
+    monkeypatch.setitem(globals(), "update_batch", interrupted)
+    # an encoder that would never exit on its own has to be killed
+    command = [sys.executable, "-c", "import time; time.sleep(60)"]
+    threads = threading.active_count()
+    t0 = time.monotonic()
+    with pytest.raises(KeyboardInterrupt):
+        export_frames(A, N, 100, None, command=command)
+    assert time.monotonic() - t0 < 30
+    assert threading.active_count() == threads
+
+
 def randomGrid(N):
     """returns a grid of NxN random values"""
     return np.random.choice(vals, N * N, p=[0.2, 0.8]).reshape(N, N)
 
 
+def randomGrids(B, N):
+    """returns a stack of B grids of NxN random values"""
+    return np.random.choice(vals, B * N * N, p=[0.2, 0.8]).reshape(B, N, N)
+
+
 def addGlider(i, j, grid):
     """adds a glider with top left cell at (i, j)"""
     glider = np.array([[0, 0, 255], [255, 0, 255], [0, 255, 255]])
@@ -87,6 +186,136 @@ def update(frameNum, img, grid, N):
     return (img,)
 
 
+def update_batch(grids):
+    """advances every grid of a BxNxN stack by one generation at once and
+    returns the population of each grid"""
+    # pad the last two axes only since every grid is its own toroidal
+    # surface - x and y wrap around within each grid
+    G = np.pad(grids == ON, ((0, 0), (1, 1), (1, 1)), "wrap")
+    C = np.zeros(grids.shape, dtype=np.uint8)
+    # compute 8-neghbor sum
+    for di in range(3):
+        for dj in range(3):
+            if di != 1 or dj != 1:
+                np.add(C, G[:, di : di + C.shape[1], dj : dj + C.shape[2]], C)
+    # apply Conway's rules
+    M = (C == 3) | ((C == 2) & G[:, 1:-1, 1:-1])
+    np.multiply(M, np.uint8(ON), grids, casting="unsafe")
+    return np.count_nonzero(M, axis=(1, 2))
+
+
+def update_stripes(src, dst, N, S=None):
+    """advances the NxN grid src by one generation into dst one stripe of S
+    rows at a time, so that both grids can be memory-mapped files"""
+    if S is None:
+        S = max(1, 2**26 // N)
+    for r0 in range(0, N, S):
+        r1 = min(r0 + S, N)
+        # read the stripe with one row above and below and wrap the columns
+        # since we use toroidal boundary conditions - x and y wrap around
+        G = np.zeros((r1 - r0 + 2, N + 2), dtype=bool)
+        G[0, 1:-1] = src[(r0 - 1) % N] == ON
+        G[1:-1, 1:-1] = src[r0:r1] == ON
+        G[-1, 1:-1] = src[r1 % N] == ON
+        G[:, 0] = G[:, -2]
+        G[:, -1] = G[:, 1]
+        C = np.zeros((r1 - r0, N), dtype=np.uint8)
+        # compute 8-neghbor sum
+        for di in range(3):
+            for dj in range(3):
+                if di != 1 or dj != 1:
+                    np.add(C, G[di : di + r1 - r0, dj : dj + N], C)
+        # apply Conway's rules
+        M = (C == 3) | ((C == 2) & G[1:-1, 1:-1])
+        # write through the uint8 loop so no wide temporary of the stripe
+        # is created on the way into dst
+        np.multiply(M, np.uint8(ON), dst[r0:r1], casting="unsafe")
+
+
+def save_checkpoint(path, grid, generation, S=None):
+    """writes the NxN grid packed as 8 cells per byte behind a header with
+    its size and generation"""
+    N = grid.shape[0]
+    if S is None:
+        S = max(1, 2**26 // N)
+    with open(path, "wb") as f:
+        np.array([N, generation], dtype="<i8").tofile(f)
+        for r0 in range(0, N, S):
+            np.packbits(grid[r0 : r0 + S] == ON, axis=1).tofile(f)
+
+
+def load_checkpoint(path, filename, S=None):
+    """returns a grid memory-mapped to filename that is restored from the
+    checkpoint at path, together with the generation of the checkpoint"""
+    N, generation = (int(v) for v in np.fromfile(path, dtype="<i8", count=2))
+    if S is None:
+        S = max(1, 2**26 // N)
+    packed = np.memmap(path, dtype=np.uint8, mode="r", offset=16, shape=(N, (N + 7) // 8))
+    grid = np.memmap(filename, dtype=np.uint8, mode="w+", shape=(N, N))
+    for r0 in range(0, N, S):
+        cells = np.unpackbits(packed[r0 : r0 + S], axis=1, count=N)
+        np.multiply(cells, np.uint8(ON), grid[r0 : r0 + S])
+    return grid, generation
+
+
+def export_frames(grid, N, frames, filename, fps=30, size=16, command=None):
+    """simulates frames generations of the NxN grid and streams every one of
+    them as raw 8-bit gray frames to ffmpeg without going through matplotlib
+
+    The simulation runs on the calling thread and hands frames to a writer
+    thread through a queue of at most size frames, which keeps memory bounded
+    when the encoder falls behind.
+    """
+    if command is None:
+        command = ["ffmpeg", "-y", "-loglevel", "error",
+                   "-f", "rawvideo", "-pix_fmt", "gray", "-s", "{}x{}".format(N, N),
+                   "-r", str(fps), "-i", "-",
+                   "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+                   "-vcodec", "libx264", "-pix_fmt", "yuv420p", filename]
+    proc = subprocess.Popen(command, stdin=subprocess.PIPE)
+    frameQueue = queue.Queue(size)
+
+    def encode():
+        broken = False
+        try:
+            while True:
+                frame = frameQueue.get()
+                if frame is None:
+                    break
+                # keep draining after a failed write so the simulation
+                # never blocks on a full queue
+                if not broken:
+                    try:
+                        proc.stdin.write(frame)
+                    except OSError:
+                        broken = True
+        finally:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+
+    writer = threading.Thread(target=encode)
+    writer.start()
+    try:
+        frameQueue.put(grid.astype(np.uint8))
+        for _ in range(frames - 1):
+            update_batch(grid[None])
+            frameQueue.put(grid.astype(np.uint8))
+    except BaseException:
+        # a partial movie is of no use, so stop the encoder right away,
+        # which also lets the writer drain the queue without blocking
+        proc.kill()
+        raise
+    finally:
+        # always release the writer and reap the encoder, even on Ctrl-C
+        frameQueue.put(None)
+        writer.join()
+        proc.wait()
+    if proc.returncode != 0:
+        raise RuntimeError("encoder exited with status {}".format(proc.returncode))
+
+
 def main():
     # Command line args are in sys.argv[1], sys.argv[2] ..
     # sys.argv[0] is the script name itself and can be ignored
@@ -100,6 +329,12 @@ def main():
     parser.add_argument("--interval", dest="interval", required=False)
     parser.add_argument("--glider", action="store_true", required=False)
     parser.add_argument("--gosper", action="store_true", required=False)
+    parser.add_argument("--batch", dest="batch", required=False)
+    parser.add_argument("--generations", dest="generations", required=False)
+    parser.add_argument("--mmap-file", dest="mmapfile", required=False)
+    parser.add_argument("--checkpoint", dest="checkpoint", required=False)
+    parser.add_argument("--resume", dest="resume", required=False)
+    parser.add_argument("--headless", action="store_true", required=False)
     args = parser.parse_args()
 
     # set grid size
@@ -112,6 +347,56 @@ def main():
     if args.interval:
         updateInterval = int(args.interval)
 
+    # run a batch of random grids without animation and report the
+    # population of every grid after each generation
+    if args.batch:
+        generations = 100
+        if args.generations:
+            generations = int(args.generations)
+        grids = randomGrids(int(args.batch), N)
+        pop = np.array([update_batch(grids) for _ in range(generations)])
+        print("Population after {} generations: {:.2f} ± {:.2f}".format(
+            generations, np.mean(pop[-1]), np.std(pop[-1])))
+        print("Extinct grids: {} of {}".format(np.count_nonzero(pop[-1] == 0), len(grids)))
+        return
+
+    # run out of core on a grid memory-mapped to a file, which is advanced
+    # stripe by stripe and checkpointed every K generations
+    if args.mmapfile:
+        generations = 100
+        if args.generations:
+            generations = int(args.generations)
+        start = 0
+        if args.resume:
+            grid, start = load_checkpoint(args.resume, args.mmapfile)
+            N = grid.shape[0]
+        else:
+            grid = np.memmap(args.mmapfile, dtype=np.uint8, mode="w+", shape=(N, N))
+            if args.glider:
+                addGlider(1, 1, grid)
+            elif args.gosper:
+                addGosperGliderGun(10, 10, grid)
+            else:
+                # populate grid with random on/off a stripe at a time
+                S = max(1, 2**26 // N)
+                for r0 in range(0, N, S):
+                    rows = min(S, N - r0)
+                    grid[r0 : r0 + rows] = np.random.choice(vals, rows * N, p=[0.2, 0.8]).reshape(rows, N)
+        nextfile = args.mmapfile + ".next"
+        other = np.memmap(nextfile, dtype=np.uint8, mode="w+", shape=(N, N))
+        for generation in range(start + 1, start + generations + 1):
+            update_stripes(grid, other, N)
+            grid, other = other, grid
+            if args.checkpoint and generation % int(args.checkpoint) == 0:
+                save_checkpoint("{}.{}.ckpt".format(args.mmapfile, generation), grid, generation)
+        # leave the last generation in the requested file
+        if generations % 2:
+            other[:] = grid
+            grid = other
+        grid.flush()
+        os.remove(nextfile)
+        return
+
     # declare grid
     grid = np.array([])
     # check if "glider" demo flag is specified
@@ -125,6 +410,14 @@ def main():
         # populate grid with random on/off - more off than on
         grid = randomGrid(N)
 
+    # write the movie straight to the encoder without any rendering
+    if args.headless and args.movfile:
+        frames = 100
+        if args.generations:
+            frames = int(args.generations)
+        export_frames(grid, N, frames, args.movfile)
+        return
+
     # set up animation
     fig, ax = plt.subplots()
     img = ax.imshow(grid, interpolation="nearest")
@@ -3,6 +3,11 @@ A simple Python/matplotlib implementation of Conway's Game of Life.
 """
 
 import sys, argparse
+import functools
+import multiprocessing
+import os
+import tracemalloc
+from multiprocessing import shared_memory
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
@@ -23,6 +28,147 @@ def test_update():
         assert np.array_equal(A, B)
 
 
+def test_update_packed():
+    for N in [63, 64, 65, 100, 128]:
+        A = randomGrid(N)
+        P = pack_grid(A)
+        assert np.array_equal(A, unpack_grid(P, N))
+        for _ in range(200):
+            update_new(0, 0, A, N)
+            update_packed(0, 0, P, N)
+            assert np.array_equal(A, unpack_grid(P, N))
+
+
+def test_update_sparse():
+    N = 256
+    A = np.zeros(N * N).reshape(N, N)
+    addGlider(1, 1, A)
+    addGosperGliderGun(100, 100, A)
+    B = A.copy()
+    changed = dirty_tiles(N)
+    for _ in range(500):
+        update_new(0, 0, A, N)
+        update_sparse(0, 0, B, N, changed)
+        assert np.array_equal(A, B)
+    assert np.count_nonzero(changed) < changed.size // 4
+    A = randomGrid(N)
+    B = A.copy()
+    changed = dirty_tiles(N)
+    for _ in range(100):
+        update_new(0, 0, A, N)
+        update_sparse(0, 0, B, N, changed)
+        assert np.array_equal(A, B)
+
+
+def test_hashlife():
+    N = 64
+    A = np.zeros(N * N).reshape(N, N)
+    addGlider(1, 1, A)
+    addGosperGliderGun(30, 10, A)
+    H = HashLife()
+    root = H.from_grid(A)
+    for _ in range(1000):
+        update_new(0, 0, A, N)
+    root = H.run(root, 1000)
+    assert np.array_equal(A, H.to_grid(root, N))
+    A = randomGrid(N)
+    H = HashLife(maxsize=10000)
+    root = H.from_grid(A)
+    for _ in range(1024):
+        update_new(0, 0, A, N)
+    root = H.advance(root, 10)
+    assert np.array_equal(A, H.to_grid(root, N))
+    for _ in range(37):
+        update_new(0, 0, A, N)
+    root = H.run(root, 37)
+    assert np.array_equal(A, H.to_grid(root, N))
+
+
+def test_hashlife_maxsize():
+    N = 64
+    A = randomGrid(N)
+    H = HashLife(maxsize=2000)
+    root = H.from_grid(A)
+    for _ in range(4):
+        root = H.advance(root, 5)
+        for _ in range(32):
+            update_new(0, 0, A, N)
+        assert np.array_equal(A, H.to_grid(root, N))
+    H.collect(root)
+    # count the nodes the caches actually keep alive, whether they are in
+    # the node table or only held by results
+    retained = H.live(list(H.nodes.values()) + [n for k in H.results for n in (k[0], H.results[k])])
+    assert retained == set(H.nodes.values())
+    assert len(retained) <= max(H.maxsize, len(H.live([root])))
+
+
+def test_update_parallel():
+    N = 100
+    A = randomGrid(N)
+    with ParallelLife(A, workers=3) as life:
+        for _ in range(50):
+            update_old(0, 0, A, N)
+            life.step()
+            assert np.array_equal(A, life.grid)
+
+
+def test_update_buffered():
+    N = 100
+    A = randomGrid(N)
+    B = A.copy()
+    life = BufferedLife(A)
+    for _ in range(1000):
+        update_new(0, 0, B, N)
+        life.step()
+        assert np.array_equal(B == ON, life.cells == 1)
+    life = BufferedLife(randomGrid(1000))
+    life.step()
+    tracemalloc.start()
+    life.step(10)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert peak < 1000 * 1000 // 16
+
+
+def test_update_blocked():
+    N = 100
+    A = randomGrid(N)
+    B = A.copy()
+    for _ in range(100):
+        for _ in range(5):
+            update_new(0, 0, A, N)
+        update_blocked(0, 0, B, N, 5, 32)
+        assert np.array_equal(A, B)
+    C = np.empty_like(B)
+    for _ in range(100):
+        for _ in range(5):
+            update_new(0, 0, A, N)
+        update_blocked(0, 0, B, N, 5, 32, C)
+        B, C = C, B
+        assert np.array_equal(A, B)
+
+
+def test_update_rule():
+    N = 100
+    A = randomGrid(N)
+    B = A.copy()
+    C = A.copy()
+    for _ in range(100):
+        update_new(0, 0, A, N)
+        update_rule(0, 0, B, N, "B3/S23")
+        update_rule(0, 0, C, N, "23/3")
+        assert np.array_equal(A, B)
+        assert np.array_equal(A, C)
+    L = compile_rule("B36/S23")
+    assert np.array_equal(np.nonzero(L[0])[0], [3, 6])
+    assert np.array_equal(np.nonzero(L[1])[0], [2, 3])
+    L = compile_rule("b2/s")
+    assert np.array_equal(np.nonzero(L[0])[0], [2])
+    assert not L[1].any()
+    with pytest.raises(ValueError):
+        compile_rule("B9/S23")
+
+
 def randomGrid(N):
     """returns a grid of NxN random values"""
     return np.random.choice(vals, N * N, p=[0.2, 0.8]).reshape(N, N)
@@ -121,6 +267,514 @@ def update_new(frameNum, img, grid, N):
     return (img,)
 
 
+@functools.lru_cache()
+def compile_rule(rule):
+    """returns a 2x9 lookup table of the next state of a Life-like rule,
+    indexed by the current state and the number of live neighbors"""
+    parts = rule.upper().split("/")
+    if len(parts) != 2:
+        raise ValueError("invalid rule {!r}".format(rule))
+    if parts[0].startswith("B") or parts[1].startswith("S"):
+        born, survive = parts[0], parts[1]
+    else:
+        # rules without letters use the classic survive/born order
+        survive, born = parts
+    born, survive = born.lstrip("B"), survive.lstrip("S")
+    if any(v not in "012345678" for v in born + survive):
+        raise ValueError("invalid rule {!r}".format(rule))
+    L = np.zeros((2, 9), dtype=bool)
+    L[0, [int(v) for v in born]] = True
+    L[1, [int(v) for v in survive]] = True
+    return L
+
+
+def update_rule(frameNum, img, grid, N, rule="B3/S23"):
+    # copy grid since we use toroidal boundary conditions - x and y wrap
+    # around so that the simulaton takes place on a toroidal surface.
+    G = np.pad(grid == ON, 1, "wrap")
+    # index the lookup table by 9 * state + count, starting from the state
+    C = np.multiply(G[1:-1, 1:-1], 9, dtype=np.uint8)
+    # compute 8-neghbor sum
+    np.add(C, G[  :-2,  :-2], C)
+    np.add(C, G[  :-2, 1:-1], C)
+    np.add(C, G[  :-2, 2:  ], C)
+    np.add(C, G[ 1:-1,  :-2], C)
+    np.add(C, G[ 1:-1, 2:  ], C)
+    np.add(C, G[ 2:  ,  :-2], C)
+    np.add(C, G[ 2:  , 1:-1], C)
+    np.add(C, G[ 2:  , 2:  ], C)
+    # apply the rule
+    M = np.take(compile_rule(rule).ravel(), C)
+    np.multiply(M, ON, grid)
+    # update data
+    #img.set_data(grid)
+    return (img,)
+
+
+def pack_grid(grid):
+    """returns the NxN grid packed as 64 cells per uint64 word"""
+    N = grid.shape[1]
+    W = (N + 63) // 64
+    B = np.zeros((grid.shape[0], W * 64), dtype=np.uint8)
+    B[:, :N] = grid == ON
+    return np.packbits(B, axis=1, bitorder="little").view("<u8")
+
+
+def unpack_grid(P, N):
+    """returns the packed grid P as an NxN grid of ON/OFF values"""
+    B = np.unpackbits(P.view(np.uint8), axis=1, count=N, bitorder="little")
+    return np.multiply(B, ON, B)
+
+
+def update_packed(frameNum, img, P, N):
+    # cell j of a row is stored in bit j % 64 of word j // 64, and the
+    # padding bits past column N in the last word are always kept zero.
+    r = np.uint64((N - 1) % 64)
+    m = np.uint64(0xFFFFFFFFFFFFFFFF) >> np.uint64(63 - (N - 1) % 64)
+    one = np.uint64(1)
+
+    def west(X):
+        # shift every cell one column east so bit j holds cell j-1
+        S = (X << one) | (np.roll(X, 1, axis=1) >> np.uint64(63))
+        S[:, 0] = (S[:, 0] & ~one) | ((X[:, -1] >> r) & one)
+        return S
+
+    def east(X):
+        # shift every cell one column west so bit j holds cell j+1
+        S = (X >> one) | (np.roll(X, -1, axis=1) << np.uint64(63))
+        S[:, -1] = (S[:, -1] & ~(one << r)) | ((X[:, 0] & one) << r)
+        S[:, -1] &= m
+        return S
+
+    # using toroidal boundary conditions - x and y wrap around
+    # so that the simulaton takes place on a toroidal surface.
+    U = np.roll(P, 1, axis=0)
+    D = np.roll(P, -1, axis=0)
+    # compute 8-neghbor sum with bit-sliced full and half adders, where
+    # the row above and below give 2-bit sums (a1, a0) and (b1, b0) and
+    # the middle row gives the 2-bit sum (c1, c0) of its two neighbors
+    UW, UE = west(U), east(U)
+    a0 = UW ^ U ^ UE
+    a1 = (UW & U) | (UE & (UW ^ U))
+    DW, DE = west(D), east(D)
+    b0 = DW ^ D ^ DE
+    b1 = (DW & D) | (DE & (DW ^ D))
+    CW, CE = west(P), east(P)
+    c0 = CW ^ CE
+    c1 = CW & CE
+    # bit 0 of the sum and its carry into the twos place
+    s0 = a0 ^ b0 ^ c0
+    k0 = (a0 & b0) | (c0 & (a0 ^ b0))
+    # the twos place holds a1 + b1 + c1 + k0, which must be exactly one
+    u0 = a1 ^ b1 ^ c1
+    u1 = (a1 & b1) | (c1 & (a1 ^ b1))
+    # apply Conway's rules, where a sum of 3 always lives and a sum of 2
+    # only keeps a live cell alive
+    P[:] = ~u1 & (u0 ^ k0) & (s0 | P)
+    P[:, -1] &= m
+    # update data
+    #img.set_data(unpack_grid(P, N))
+    return (img,)
+
+
+def dirty_tiles(N, T=32):
+    """returns a mask that marks every TxT tile of an NxN grid as changed"""
+    n = (N + T - 1) // T
+    return np.ones((n, n), dtype=bool)
+
+
+def update_sparse(frameNum, img, grid, N, changed, T=32):
+    # a tile can only change if itself or one of its 8 neighbor tiles
+    # changed in the last generation, so every other tile is skipped
+    D = changed.copy()
+    for di in (-1, 0, 1):
+        for dj in (-1, 0, 1):
+            np.logical_or(D, np.roll(changed, (di, dj), axis=(0, 1)), D)
+    changed[:] = False
+    tiles = []
+    for ti, tj in zip(*np.nonzero(D)):
+        i0, j0 = ti * T, tj * T
+        i1, j1 = min(i0 + T, N), min(j0 + T, N)
+        # gather the tile with a one cell border using toroidal boundary
+        # conditions - x and y wrap around
+        rows = np.arange(i0 - 1, i1 + 1) % N
+        cols = np.arange(j0 - 1, j1 + 1) % N
+        G = grid[np.ix_(rows, cols)] == ON
+        C = np.zeros((i1 - i0, j1 - j0), dtype=np.uint8)
+        # compute 8-neghbor sum
+        np.add(C, G[  :-2,  :-2], C)
+        np.add(C, G[  :-2, 1:-1], C)
+        np.add(C, G[  :-2, 2:  ], C)
+        np.add(C, G[ 1:-1,  :-2], C)
+        np.add(C, G[ 1:-1, 2:  ], C)
+        np.add(C, G[ 2:  ,  :-2], C)
+        np.add(C, G[ 2:  , 1:-1], C)
+        np.add(C, G[ 2:  , 2:  ], C)
+        # apply Conway's rules
+        M = (C == 3) | ((C == 2) & G[1:-1, 1:-1])
+        if not np.array_equal(M, G[1:-1, 1:-1]):
+            changed[ti, tj] = True
+            tiles.append((i0, i1, j0, j1, M))
+    # write back only once every tile has been computed from the old grid
+    for i0, i1, j0, j1, M in tiles:
+        np.multiply(M, ON, grid[i0:i1, j0:j1])
+    # update data
+    #img.set_data(grid)
+    return (img,)
+
+
+def update_blocked(frameNum, img, grid, N, k=8, T=512, newGrid=None):
+    # advance every TxT tile k generations while it is still in cache,
+    # which needs a k cell ghost zone since the valid region of the tile
+    # shrinks by one cell per generation. Callers that pass a second
+    # buffer as newGrid get the result there and swap the pair themselves,
+    # which saves both the allocation and the copy back into grid
+    inplace = newGrid is None
+    if inplace:
+        newGrid = np.empty((N, N), dtype=np.uint8)
+    C = np.empty((T + 2 * k, T + 2 * k), dtype=np.uint8)
+    X = np.empty((T + 2 * k, T + 2 * k), dtype=np.uint8)
+    Y = np.empty((T + 2 * k, T + 2 * k), dtype=np.uint8)
+    for i0 in range(0, N, T):
+        for j0 in range(0, N, T):
+            i1, j1 = min(i0 + T, N), min(j0 + T, N)
+            h, w = i1 - i0 + 2 * k, j1 - j0 + 2 * k
+            # using toroidal boundary conditions - x and y wrap around
+            if i0 >= k and j0 >= k and i1 + k <= N and j1 + k <= N:
+                S = grid[i0 - k : i1 + k, j0 - k : j1 + k]
+            else:
+                rows = np.arange(i0 - k, i1 + k) % N
+                cols = np.arange(j0 - k, j1 + k) % N
+                S = grid[np.ix_(rows, cols)]
+            np.equal(S, ON, X[:h, :w].view(bool))
+            G, H = X, Y
+            for _ in range(k):
+                A = G[:h, :w]
+                h, w = h - 2, w - 2
+                D = C[:h, :w]
+                # compute 8-neghbor sum
+                np.add(A[  :-2,  :-2], A[  :-2, 1:-1], D)
+                np.add(D, A[  :-2, 2:  ], D)
+                np.add(D, A[ 1:-1,  :-2], D)
+                np.add(D, A[ 1:-1, 2:  ], D)
+                np.add(D, A[ 2:  ,  :-2], D)
+                np.add(D, A[ 2:  , 1:-1], D)
+                np.add(D, A[ 2:  , 2:  ], D)
+                # apply Conway's rules, where a count of 3 or a live cell
+                # with a count of 2 are exactly the cases with
+                # (count | cell) == 3
+                np.bitwise_or(D, A[1:-1, 1:-1], D)
+                np.equal(D, 3, H[:h, :w].view(bool))
+                G, H = H, G
+            np.multiply(G[:h, :w], np.uint8(ON), newGrid[i0:i1, j0:j1])
+    if inplace:
+        grid[:] = newGrid
+    # update data
+    #img.set_data(grid)
+    return (img,)
+
+
+class Node:
+    """a quadtree node of 2^level x 2^level cells"""
+
+    __slots__ = ("level", "nw", "ne", "sw", "se", "pop")
+
+    def __init__(self, level, nw, ne, sw, se, pop):
+        self.level = level
+        self.nw = nw
+        self.ne = ne
+        self.sw = sw
+        self.se = se
+        self.pop = pop
+
+
+class HashLife:
+    """advances a 2^k x 2^k toroidal grid by 2^j generations per call
+
+    Quadtree nodes are shared through a memoized join, and the center of
+    every node advanced 2^j generations is memoized as well. Once the two
+    caches together hold more than maxsize entries, the next advance first
+    collects them: only the nodes of the current grid and the results of
+    those nodes are kept, and everything else is released. An advance itself
+    always runs with its whole working set cached, so it never recomputes.
+    """
+
+    def __init__(self, maxsize=2**22):
+        self.maxsize = maxsize
+        self.leaves = (Node(0, None, None, None, None, 0),
+                       Node(0, None, None, None, None, 1))
+        self.nodes = {}
+        self.results = {}
+
+    def join(self, nw, ne, sw, se):
+        key = (nw, ne, sw, se)
+        n = self.nodes.get(key)
+        if n is None:
+            pop = nw.pop + ne.pop + sw.pop + se.pop
+            n = self.nodes[key] = Node(nw.level + 1, nw, ne, sw, se, pop)
+        return n
+
+    def step(self, n, j):
+        key = (n, j)
+        r = self.results.get(key)
+        if r is None:
+            r = self.results[key] = self._step(n, j)
+        return r
+
+    def live(self, roots):
+        """returns the set of nodes above the leaves reachable from roots"""
+        seen = set()
+        stack = list(roots)
+        while stack:
+            n = stack.pop()
+            if n.level > 0 and n not in seen:
+                seen.add(n)
+                stack.extend((n.nw, n.ne, n.sw, n.se))
+        return seen
+
+    def collect(self, root):
+        """drops every cached node and result that root no longer uses"""
+        live = self.live([root])
+        results = {k: r for k, r in self.results.items() if k[0] in live}
+        live |= self.live(results.values())
+        if len(live) + len(results) > self.maxsize:
+            # the results alone are over budget, so keep just the grid
+            results = {}
+            live = self.live([root])
+        self.results = results
+        self.nodes = {(n.nw, n.ne, n.sw, n.se): n for n in live}
+
+    def _step(self, n, j):
+        # returns the center of n advanced 2^j generations, for j <= level-2
+        if n.level == 2:
+            return self._base(n)
+        if n.pop == 0:
+            return n.nw
+        join = self.join
+        nw, ne, sw, se = n.nw, n.ne, n.sw, n.se
+        # the 9 overlapping subnodes of half the size
+        S = [nw, join(nw.ne, ne.nw, nw.se, ne.sw), ne,
+             join(nw.sw, nw.se, sw.nw, sw.ne), join(nw.se, ne.sw, sw.ne, se.nw),
+             join(ne.sw, ne.se, se.nw, se.ne),
+             sw, join(sw.ne, se.nw, sw.se, se.sw), se]
+        if j == n.level - 2:
+            # advance twice by half the step when taking the full step
+            R = [self.step(v, j - 1) for v in S]
+            j = j - 1
+        else:
+            R = [join(v.nw.se, v.ne.sw, v.sw.ne, v.se.nw) for v in S]
+        return join(self.step(join(R[0], R[1], R[3], R[4]), j),
+                    self.step(join(R[1], R[2], R[4], R[5]), j),
+                    self.step(join(R[3], R[4], R[6], R[7]), j),
+                    self.step(join(R[4], R[5], R[7], R[8]), j))
+
+    def _base(self, n):
+        # advance the 4x4 node by one generation the direct way
+        B = [[0] * 4 for _ in range(4)]
+        for i, q in ((0, n.nw), (1, n.ne), (2, n.sw), (3, n.se)):
+            for k, v in ((0, q.nw), (1, q.ne), (2, q.sw), (3, q.se)):
+                B[2 * (i // 2) + k // 2][2 * (i % 2) + k % 2] = v.pop
+        R = []
+        for i in (1, 2):
+            for j in (1, 2):
+                total = sum(B[i + a][j + b] for a in (-1, 0, 1) for b in (-1, 0, 1))
+                total -= B[i][j]
+                R.append(self.leaves[int(total == 3 or (total == 2 and B[i][j] == 1))])
+        return self.join(*R)
+
+    def advance(self, root, j):
+        """returns the toroidal grid root advanced 2^j generations"""
+        if len(self.nodes) + len(self.results) > self.maxsize:
+            self.collect(root)
+        k = root.level
+        # the torus is an infinite periodic pattern, so a node tiled from
+        # 2^m x 2^m copies of the root holds enough context for the step
+        m = max(1, j - k + 2)
+        big = root
+        for _ in range(m):
+            big = self.join(big, big, big, big)
+        R = self.step(big, j)
+        while R.level > k:
+            R = R.nw
+        if m == 1:
+            # the center of a 2x2 tiling is the torus shifted by half
+            R = self.join(R.se, R.sw, R.ne, R.nw)
+        return R
+
+    def run(self, root, generations):
+        """returns the toroidal grid root advanced any number of generations"""
+        j = 0
+        while generations:
+            if generations & 1:
+                root = self.advance(root, j)
+            generations >>= 1
+            j += 1
+        return root
+
+    def from_grid(self, grid):
+        """returns the root node of an NxN grid where N is a power of two"""
+        N = grid.shape[0]
+        if N < 4 or N & (N - 1) or grid.shape != (N, N):
+            raise ValueError("HashLife requires an NxN grid with N a power of two")
+        B = grid == ON
+        T = np.empty((N, N), dtype=object)
+        for i in range(N):
+            for j in range(N):
+                T[i, j] = self.leaves[int(B[i, j])]
+        while T.shape[0] > 1:
+            n = T.shape[0] // 2
+            U = np.empty((n, n), dtype=object)
+            for i in range(n):
+                for j in range(n):
+                    U[i, j] = self.join(T[2 * i, 2 * j], T[2 * i, 2 * j + 1],
+                                        T[2 * i + 1, 2 * j], T[2 * i + 1, 2 * j + 1])
+            T = U
+        return T[0, 0]
+
+    def to_grid(self, root, N):
+        """returns the root node as an NxN grid of ON/OFF values"""
+        grid = np.zeros((N, N), dtype=np.uint8)
+
+        def fill(n, i, j):
+            if n.pop == 0:
+                return
+            if n.level == 0:
+                grid[i, j] = ON
+                return
+            h = 1 << (n.level - 1)
+            fill(n.nw, i, j)
+            fill(n.ne, i, j + h)
+            fill(n.sw, i + h, j)
+            fill(n.se, i + h, j + h)
+
+        fill(root, 0, 0)
+        return grid
+
+
+def _attach_bands(name, N):
+    # each worker maps the shared ping-pong buffers once at startup
+    global _band_shm, _band_buf
+    _band_shm = shared_memory.SharedMemory(name=name)
+    _band_buf = np.ndarray((2, N, N), dtype=np.uint8, buffer=_band_shm.buf)
+
+
+def _step_band(src, r0, r1):
+    A = _band_buf[src]
+    N = A.shape[0]
+    # copy the band together with its one row halo from the neighboring
+    # bands, using toroidal boundary conditions - x and y wrap around
+    G = np.empty((r1 - r0 + 2, N + 2), dtype=bool)
+    np.equal(A[(r0 - 1) % N], ON, G[0, 1:-1])
+    np.equal(A[r0:r1], ON, G[1:-1, 1:-1])
+    np.equal(A[r1 % N], ON, G[-1, 1:-1])
+    G[:, 0] = G[:, -2]
+    G[:, -1] = G[:, 1]
+    C = np.zeros((r1 - r0, N), dtype=np.uint8)
+    # compute 8-neghbor sum
+    np.add(C, G[  :-2,  :-2], C)
+    np.add(C, G[  :-2, 1:-1], C)
+    np.add(C, G[  :-2, 2:  ], C)
+    np.add(C, G[ 1:-1,  :-2], C)
+    np.add(C, G[ 1:-1, 2:  ], C)
+    np.add(C, G[ 2:  ,  :-2], C)
+    np.add(C, G[ 2:  , 1:-1], C)
+    np.add(C, G[ 2:  , 2:  ], C)
+    # apply Conway's rules
+    M = (C == 3) | ((C == 2) & G[1:-1, 1:-1])
+    np.multiply(M, np.uint8(ON), _band_buf[1 - src, r0:r1])
+
+
+class ParallelLife:
+    """steps an NxN toroidal grid in row bands on a pool of processes
+
+    The grid lives in shared memory as two buffers that the bands read from
+    and write to in turn, so between generations a band only reads the one
+    row halo of its neighbors besides its own rows.
+    """
+
+    def __init__(self, grid, workers=None):
+        N = grid.shape[0]
+        workers = min(workers or os.cpu_count(), N)
+        self.shm = shared_memory.SharedMemory(create=True, size=2 * N * N)
+        self.buf = np.ndarray((2, N, N), dtype=np.uint8, buffer=self.shm.buf)
+        self.src = 0
+        np.multiply(grid == ON, np.uint8(ON), self.buf[0])
+        edges = np.linspace(0, N, workers + 1).astype(int)
+        self.bands = list(zip(edges[:-1], edges[1:]))
+        self.pool = multiprocessing.Pool(workers, _attach_bands, (self.shm.name, N))
+
+    @property
+    def grid(self):
+        """the current generation as an NxN grid of ON/OFF values"""
+        return self.buf[self.src]
+
+    def step(self, generations=1):
+        for _ in range(generations):
+            self.pool.starmap(_step_band, [(self.src, r0, r1) for r0, r1 in self.bands])
+            self.src = 1 - self.src
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        del self.buf
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BufferedLife:
+    """steps an NxN toroidal grid without allocating arrays per generation
+
+    Two ping-pong buffers of 0/1 cells carry a one cell ghost border that
+    is refreshed in place, and every view and temporary used by a step is
+    created once up front, so only numpy's small fixed-size iteration
+    buffers are left to allocate.
+    """
+
+    def __init__(self, grid):
+        N = grid.shape[0]
+        self.bufs = np.zeros((2, N + 2, N + 2), dtype=np.uint8)
+        self.C = np.empty((N, N), dtype=np.uint8)
+        self.src = 0
+        self.views = []
+        for G in self.bufs:
+            # the ghost border is copied from the opposite edge since we use
+            # toroidal boundary conditions - x and y wrap around
+            ghosts = [(G[0, 1:-1], G[-2, 1:-1]), (G[-1, 1:-1], G[1, 1:-1]),
+                      (G[:, 0], G[:, -2]), (G[:, -1], G[:, 1])]
+            neighbors = [G[  :-2,  :-2], G[  :-2, 1:-1], G[  :-2, 2:  ],
+                         G[ 1:-1,  :-2],                 G[ 1:-1, 2:  ],
+                         G[ 2:  ,  :-2], G[ 2:  , 1:-1], G[ 2:  , 2:  ]]
+            self.views.append((G[1:-1, 1:-1], ghosts, neighbors, G[1:-1, 1:-1].view(bool)))
+        np.equal(grid, ON, self.views[0][0])
+
+    @property
+    def cells(self):
+        """the current generation as an NxN view of 0/1 cells"""
+        return self.views[self.src][0]
+
+    def step(self, generations=1):
+        C = self.C
+        for _ in range(generations):
+            cells, ghosts, neighbors = self.views[self.src][:3]
+            for dst, src in ghosts:
+                np.copyto(dst, src)
+            # compute 8-neghbor sum
+            np.add(neighbors[0], neighbors[1], C)
+            for v in neighbors[2:]:
+                np.add(C, v, C)
+            # apply Conway's rules, where a count of 3 or a live cell with a
+            # count of 2 are exactly the cases with (count | cell) == 3
+            np.bitwise_or(C, cells, C)
+            self.src = 1 - self.src
+            np.equal(C, 3, self.views[self.src][3])
+
+
 def main():
     # Command line args are in sys.argv[1], sys.argv[2] ..
     # sys.argv[0] is the script name itself and can be ignored
@@ -134,18 +788,33 @@ def main():
     parser.add_argument("--interval", dest="interval", required=False)
     parser.add_argument("--glider", action="store_true", required=False)
     parser.add_argument("--gosper", action="store_true", required=False)
+    parser.add_argument("--packed", action="store_true", required=False)
+    parser.add_argument("--sparse", action="store_true", required=False)
+    parser.add_argument("--hashlife", action="store_true", required=False)
+    parser.add_argument("--generations", dest="generations", required=False)
+    parser.add_argument("--workers", dest="workers", required=False)
+    parser.add_argument("--buffered", action="store_true", required=False)
+    parser.add_argument("--blocked", action="store_true", required=False)
+    parser.add_argument("--rule", dest="rule", required=False)
     args = parser.parse_args()
 
     # set grid size
     N = 100
     if args.N and int(args.N) > 8:
         N = int(args.N)
+    if args.hashlife and N & (N - 1):
+        parser.error("--hashlife requires a --grid-size that is a power of two")
 
     # set animation update interval
     updateInterval = 50
     if args.interval:
         updateInterval = int(args.interval)
 
+    # set number of generations to simulate
+    generations = 1000
+    if args.generations:
+        generations = int(args.generations)
+
     # declare grid
     grid = np.array([])
     # check if "glider" demo flag is specified
@@ -176,8 +845,42 @@ def main():
     #if args.movfile:
     #    ani.save(args.movfile, fps=30, extra_args=["-vcodec", "libx264"])
     
-    for _ in range(1000):
-        update_new(0, 0, grid, N)
+    if args.packed:
+        P = pack_grid(grid)
+        for _ in range(generations):
+            update_packed(0, 0, P, N)
+        grid[:] = unpack_grid(P, N)
+    elif args.hashlife:
+        H = HashLife()
+        grid[:] = H.to_grid(H.run(H.from_grid(grid), generations), N)
+    elif args.workers:
+        with ParallelLife(grid, int(args.workers)) as life:
+            life.step(generations)
+            grid[:] = life.grid
+    elif args.buffered:
+        life = BufferedLife(grid)
+        life.step(generations)
+        np.multiply(life.cells, ON, grid, casting="unsafe")
+    elif args.blocked:
+        src, dst = grid, np.empty_like(grid)
+        for _ in range(generations // 8):
+            update_blocked(0, 0, src, N, 8, newGrid=dst)
+            src, dst = dst, src
+        if generations % 8:
+            update_blocked(0, 0, src, N, generations % 8, newGrid=dst)
+            src, dst = dst, src
+        if src is not grid:
+            grid[:] = src
+    elif args.rule:
+        for _ in range(generations):
+            update_rule(0, 0, grid, N, args.rule)
+    elif args.sparse:
+        changed = dirty_tiles(N)
+        for _ in range(generations):
+            update_sparse(0, 0, grid, N, changed)
+    else:
+        for _ in range(generations):
+            update_new(0, 0, grid, N)
     
     #plt.show()
 
@@ -3,9 +3,14 @@ A simple Python/matplotlib implementation of Conway's Game of Life.
 """
 
 import sys, argparse
+import json
+import os
+import platform
+import warnings
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
+import pytest
 import timeit
 
 ON = 255
@@ -13,6 +18,34 @@ OFF = 0
 vals = [ON, OFF]
 
 
+def test_compare():
+    meta = {"host": "a", "machine": "x86_64", "python": "3.11.7", "numpy": "1.26.4", "cpu": 0}
+    baseline = dict(meta, results=[
+        {"stepper": "Default", "N": 64, "median": 1.0},
+        {"stepper": "Default", "N": 128, "median": 4.0},
+        {"stepper": "Optimized", "N": 64, "median": 0.1},
+    ])
+    results = [
+        {"stepper": "Default", "N": 64, "median": 1.05},
+        {"stepper": "Default", "N": 128, "median": 4.5},
+        {"stepper": "Optimized", "N": 64, "median": 0.2},
+        # missing from the baseline, so never a regression
+        {"stepper": "Optimized", "N": 128, "median": 9.0},
+    ]
+    slower = compare(results, baseline, 0.1, meta)
+    assert [(r["stepper"], r["N"], base) for r, base in slower] == [("Default", 128, 4.0), ("Optimized", 64, 0.1)]
+    assert len(compare(results, baseline, 1.5, meta)) == 0
+    assert len(compare(results, dict(baseline, results=[]), 0.1, meta)) == 0
+    with pytest.raises(ValueError, match="host"):
+        compare(results, dict(baseline, host="b"), 0.1, meta)
+    with pytest.raises(ValueError, match="cpu"):
+        compare(results, dict(baseline, cpu=None), 0.1, meta)
+    with pytest.raises(ValueError, match="numpy"):
+        compare(results, {k: v for k, v in baseline.items() if k != "numpy"}, 0.1, meta)
+    with pytest.warns(UserWarning, match="host"):
+        assert len(compare(results, dict(baseline, host="b"), 0.1, meta, strict=False)) == 2
+
+
 def randomGrid(N):
     """returns a grid of NxN random values"""
     return np.random.choice(vals, N * N, p=[0.2, 0.8]).reshape(N, N)
@@ -111,6 +144,77 @@ def update_new(frameNum, img, grid, N):
     return (img,)
 
 
+# steppers measured by the benchmark, keyed by the label used in the plot
+steppers = {
+    "Default": update_old,
+    "Optimized": update_new,
+}
+
+
+def benchmark(update, N, repeats=20, warmup=2):
+    """returns timing statistics of one generation of update on a random
+    NxN grid, measured after a number of warmup generations"""
+    grid = randomGrid(N)
+    for _ in range(warmup):
+        update(0, 0, grid, N)
+    t = []
+    for _ in range(repeats):
+        t0 = timeit.default_timer()
+        update(0, 0, grid, N)
+        t1 = timeit.default_timer()
+        t.append(t1 - t0)
+    median = float(np.median(t))
+    return {
+        "N": N,
+        "times": t,
+        "mean": float(np.mean(t)),
+        "std": float(np.std(t)),
+        "median": median,
+        "p5": float(np.percentile(t, 5)),
+        "p95": float(np.percentile(t, 95)),
+        "cells_per_second": N * N / median,
+        # lower bound that reads and writes the grid once per generation
+        "bandwidth": 2 * grid.nbytes / median * 1e-6,
+    }
+
+
+def metadata(cpu=None):
+    """returns what a run was measured on, which has to match for two runs
+    to be comparable"""
+    return {
+        "host": platform.node(),
+        "machine": platform.machine(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "cpu": cpu,
+    }
+
+
+def compare(results, baseline, tolerance, meta=None, strict=True):
+    """returns the results whose median time is slower than the median of
+    the same stepper and grid size in baseline by more than tolerance
+
+    When meta is given, a baseline recorded on another host, machine,
+    Python, numpy or CPU pinning raises ValueError, or only warns when
+    strict is false, since its timings say nothing about this run.
+    """
+    if meta is not None:
+        mismatched = ["{} {!r} != {!r}".format(k, baseline.get(k), v)
+                      for k, v in meta.items() if baseline.get(k) != v]
+        if mismatched:
+            message = "baseline is not comparable: " + ", ".join(mismatched)
+            if strict:
+                raise ValueError(message)
+            warnings.warn(message)
+    base = {(r["stepper"], r["N"]): r["median"] for r in baseline["results"]}
+    slower = []
+    for r in results:
+        key = (r["stepper"], r["N"])
+        if key in base and r["median"] > base[key] * (1 + tolerance):
+            slower.append((r, base[key]))
+    return slower
+
+
 def main():
     # Command line args are in sys.argv[1], sys.argv[2] ..
     # sys.argv[0] is the script name itself and can be ignored
@@ -124,6 +228,15 @@ def main():
     parser.add_argument("--interval", dest="interval", required=False)
     parser.add_argument("--glider", action="store_true", required=False)
     parser.add_argument("--gosper", action="store_true", required=False)
+    parser.add_argument("--sizes", dest="sizes", required=False)
+    parser.add_argument("--repeats", dest="repeats", required=False)
+    parser.add_argument("--warmup", dest="warmup", required=False)
+    parser.add_argument("--cpu", dest="cpu", required=False)
+    parser.add_argument("--json", dest="json", required=False)
+    parser.add_argument("--baseline", dest="baseline", required=False)
+    parser.add_argument("--tolerance", dest="tolerance", required=False)
+    parser.add_argument("--no-plot", action="store_true", required=False)
+    parser.add_argument("--allow-mismatch", action="store_true", required=False)
     args = parser.parse_args()
 
     # set grid size
@@ -166,41 +279,72 @@ def main():
     #if args.movfile:
     #    ani.save(args.movfile, fps=30, extra_args=["-vcodec", "libx264"])
     
-    fig, ax = plt.subplots(figsize=(12, 5), constrained_layout=True)
-    fig.supxlabel("Grid size (N×N)")
-    fig.supylabel("Iteration time (s)")
+    # pin the benchmark to a single core to reduce the variance
+    if args.cpu and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {int(args.cpu)})
+
     xticks = [8, 16, 32, 64, 128, 256, 512, 1024]
-    yticks = [4e-5, 4e-4, 4e-3, 4e-2, 4e-1, 4e-0]
-    x = [[], []]
-    y = [[], []]
+    if args.sizes:
+        xticks = [int(v) for v in args.sizes.split(",")]
+    repeats = 20
+    if args.repeats:
+        repeats = int(args.repeats)
+    warmup = 2
+    if args.warmup:
+        warmup = int(args.warmup)
+    results = []
     for n in xticks:
-        A = randomGrid(n)
-        B = A.copy()
-        for _ in range(20):
-            t0 = timeit.default_timer()
-            update_old(0, 0, A, n)
-            t1 = timeit.default_timer()
-            x[0].append(n)
-            y[0].append(t1 - t0)
-        for _ in range(20):
-            t0 = timeit.default_timer()
-            update_new(0, 0, B, n)
-            t1 = timeit.default_timer()
-            x[1].append(n)
-            y[1].append(t1 - t0)
-    ax.grid()
-    ax.scatter(x[0], y[0], alpha=0.25, color="C0", label="Default")
-    ax.scatter(x[1], y[1], alpha=0.25, color="C1", label="Optimized")
-    ax.legend(loc="center left", bbox_to_anchor=(1, 0.5))
-    plt.xscale("log")
-    plt.yscale("log")
-    plt.xlim(xticks[0], xticks[-1])
-    plt.ylim(yticks[0], yticks[-1])
-    plt.xticks(xticks, [f"{v:d}×{v:d}" for v in xticks])
-    plt.yticks(yticks, [f"{v:.5f}"     for v in yticks])
-    plt.minorticks_off()
-    
-    plt.show()
+        for name, update in steppers.items():
+            r = benchmark(update, n, repeats, warmup)
+            r["stepper"] = name
+            results.append(r)
+            print("{:<10s} {:5d}×{:<5d} {:12.6f} s  [{:.6f}, {:.6f}]  {:14.0f} cells/s  {:10.2f} MB/s".format(
+                name, n, n, r["median"], r["p5"], r["p95"], r["cells_per_second"], r["bandwidth"]))
+
+    meta = metadata(int(args.cpu) if args.cpu else None)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(dict(meta, repeats=repeats, warmup=warmup, results=results), f, indent=2)
+
+    # compare against a stored baseline and fail when anything regressed
+    regressed = False
+    if args.baseline:
+        tolerance = 0.1
+        if args.tolerance:
+            tolerance = float(args.tolerance)
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        try:
+            slower = compare(results, baseline, tolerance, meta, not args.allow_mismatch)
+        except ValueError as e:
+            parser.error("{} (use --allow-mismatch to compare anyway)".format(e))
+        for r, base in slower:
+            regressed = True
+            print("Regression: {} at {:d}×{:d} takes {:.6f} s, baseline {:.6f} s".format(
+                r["stepper"], r["N"], r["N"], r["median"], base))
+
+    if not args.no_plot:
+        fig, ax = plt.subplots(figsize=(12, 5), constrained_layout=True)
+        fig.supxlabel("Grid size (N×N)")
+        fig.supylabel("Iteration time (s)")
+        yticks = [4e-5, 4e-4, 4e-3, 4e-2, 4e-1, 4e-0]
+        for i, name in enumerate(steppers):
+            x = [r["N"] for r in results if r["stepper"] == name for _ in r["times"]]
+            y = [v for r in results if r["stepper"] == name for v in r["times"]]
+            ax.scatter(x, y, alpha=0.25, color=f"C{i:d}", label=name)
+        ax.grid()
+        ax.legend(loc="center left", bbox_to_anchor=(1, 0.5))
+        plt.xscale("log")
+        plt.yscale("log")
+        plt.xlim(xticks[0], xticks[-1])
+        plt.ylim(yticks[0], yticks[-1])
+        plt.xticks(xticks, [f"{v:d}×{v:d}" for v in xticks])
+        plt.yticks(yticks, [f"{v:.5f}"     for v in yticks])
+        plt.minorticks_off()
+        plt.show()
+
+    if regressed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":